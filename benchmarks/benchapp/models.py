@@ -0,0 +1,21 @@
+# Copyright (C) 2014 Glamping Hub (https://glampinghub.com)
+# License: BSD 3-Clause
+from __future__ import unicode_literals
+
+from django.db import models
+from django.utils.translation import get_language
+
+
+class Category(models.Model):
+    name = models.CharField(max_length=100)
+    parent = models.ForeignKey('self', null=True, blank=True,
+                               on_delete=models.CASCADE)
+
+
+class Article(models.Model):
+    name = models.CharField(max_length=100)
+    category = models.ForeignKey(Category, null=True, blank=True,
+                                 on_delete=models.CASCADE)
+
+    def get_absolute_url(self):
+        return '/%s/article/%d/' % (get_language()[:2], self.pk)
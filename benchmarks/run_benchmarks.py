@@ -0,0 +1,571 @@
+# Copyright (C) 2014 Glamping Hub (https://glampinghub.com)
+# License: BSD 3-Clause
+"""
+run_benchmarks.py
+
+    Measures the SEO resolution hot path on synthetic SQLite datasets and
+    saves the results as JSON, so they can be compared between versions:
+
+    $> python benchmarks/run_benchmarks.py --rows 10000 100000 \
+           --output before.json
+    $> python benchmarks/run_benchmarks.py --rows 10000 100000 \
+           --output after.json --compare before.json
+
+    With --memory, the memory taken by the in process copies of the
+    SeoMetadata rows is measured too, as model instances and as records.
+
+"""
+from __future__ import unicode_literals
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCHMARKS_DIR, os.path.dirname(BENCHMARKS_DIR)]
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+LANGUAGES = [
+    ('en', 'English'),
+    ('es', 'Spanish'),
+    ('fr', 'French'),
+    ('de', 'German'),
+    ('it', 'Italian'),
+]
+PERCENTILES = [50, 90, 99]
+BATCH_SIZE = 5000
+WARMUP_CALLS = 100
+# Not used, the template tags only need a ROOT_URLCONF
+urlpatterns = []
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the painlessseo resolution hot path.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000],
+                        help='SeoMetadata rows of every dataset, e.g. '
+                        '10000 100000 1000000')
+    parser.add_argument('--pattern-ratio', type=float, default=0.05,
+                        help='Share of the rows that are parameterized paths')
+    parser.add_argument('--languages', type=int, default=2,
+                        choices=range(1, len(LANGUAGES) + 1),
+                        help='Number of languages of the dataset')
+    parser.add_argument('--depth', type=int, default=2,
+                        choices=range(0, 5),
+                        help='Relations followed by the instance '
+                        'placeholders, 0 for no placeholders')
+    parser.add_argument('--samples', type=int, default=1000,
+                        help='Measured calls for every scenario')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--snapshot', action='store_true',
+                        help='Enable SEO_RESOLVER_SNAPSHOT')
+    parser.add_argument('--shared-cache', action='store_true',
+                        help='Enable SEO_CACHE_ALIAS with a local memory '
+                        'cache')
+    parser.add_argument('--routing', action='store_true',
+                        help='Resolve from a routing file compiled after '
+                        'building every dataset')
+    parser.add_argument('--memory', action='store_true',
+                        help='Measure the memory of the in process copies '
+                        'of the rows')
+    parser.add_argument('--database', default=None,
+                        help='SQLite file to use, a temporary one by default')
+    parser.add_argument('--label', default='',
+                        help='Free text saved with the results, e.g. the '
+                        'version being measured')
+    parser.add_argument('--output', default=None,
+                        help='File where the JSON results are written')
+    parser.add_argument('--compare', default=None,
+                        help='Previous JSON results to compare with')
+    return parser.parse_args(argv)
+
+
+def configure(options):
+    languages = LANGUAGES[:options.languages]
+    settings.configure(
+        DEBUG=False,
+        SECRET_KEY='painlessseo-benchmarks',
+        INSTALLED_APPS=[
+            'django.contrib.contenttypes',
+            'painlessseo',
+            'benchapp',
+        ],
+        DATABASES={
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': options.database,
+            },
+        },
+        CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+        },
+        TEMPLATES=[{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'APP_DIRS': True,
+        }],
+        ROOT_URLCONF=__name__,
+        USE_I18N=True,
+        LANGUAGE_CODE='en',
+        LANGUAGES=languages,
+        DEFAULT_SEO_TITLES=dict(
+            (lang_code, ['Fallback %s' % lang_code, 'Other %s' % lang_code])
+            for lang_code, language in languages),
+        DEFAULT_SEO_DESCRIPTIONS=dict(
+            (lang_code, 'Fallback description %s' % lang_code)
+            for lang_code, language in languages),
+        SEO_MODELS=[('benchapp', 'Article')],
+        SEO_RESOLVER_SNAPSHOT=options.snapshot,
+        SEO_CACHE_ALIAS='default' if options.shared_cache else None,
+        SEO_ROUTING_FILE=(options.database + '.routes' if options.routing
+                          else None),
+    )
+    django.setup()
+
+
+def get_placeholder(depth):
+    """
+    Returns the instance placeholder following 'depth' relations, e.g.
+    '{category.parent.name}' for 2.
+    """
+    if depth == 0:
+        return ''
+    return '{%s}' % '.'.join(
+        ['category'] + ['parent'] * (depth - 1) + ['name'])
+
+
+class Dataset(object):
+    """
+    Synthetic SEO content with 'rows' SeoMetadata:
+
+    - 'pattern_ratio' of them are parameterized paths, '/section-N/{0}/'.
+    - Half of the rest belong to Articles, one per language.
+    - The rest are plain pages, translated to every language but the last
+      one for half of them.
+    """
+
+    def __init__(self, rows, options):
+        from benchapp.models import Article, Category
+        from painlessseo.models import SeoMetadata, SeoRegisteredModel
+        from django.contrib.contenttypes.models import ContentType
+
+        self.random = random.Random(options.seed)
+        self.languages = [lang_code for lang_code, language in
+                          LANGUAGES[:options.languages]]
+        self.default_lang = self.languages[0]
+        self.placeholder = get_placeholder(options.depth)
+
+        for model in [SeoMetadata, SeoRegisteredModel, Article, Category]:
+            model.objects.all()._raw_delete(model.objects.db)
+
+        # Chains of categories, so every placeholder relation exists
+        parents = [None] * 10
+        for level in range(max(options.depth, 1)):
+            Category.objects.bulk_create([
+                Category(name='Category %d.%d' % (level, position),
+                         parent=parent)
+                for position, parent in enumerate(parents)])
+            parents = list(Category.objects.order_by('-id')[:len(parents)])
+
+        self.patterns = max(int(rows * options.pattern_ratio), 1)
+        remaining = rows - self.patterns
+        article_count = max(remaining // 2 // len(self.languages), 1)
+        # Every two pages take 2 * languages - 1 rows
+        page_rows = 2 * len(self.languages) - (len(self.languages) > 1)
+        page_count = max((remaining - article_count * len(self.languages)) *
+                         2 // page_rows, 1)
+
+        Article.objects.bulk_create([
+            Article(name='Article %d' % position,
+                    category=parents[position % len(parents)])
+            for position in range(article_count)], batch_size=BATCH_SIZE)
+        ctype = ContentType.objects.get_for_model(Article)
+        # Used by sync_seo_models
+        Article.DEFAULT_SEO_TITLES = dict(
+            (lang_code, 'Registered %s %s' % (lang_code, self.placeholder))
+            for lang_code in self.languages)
+        Article.DEFAULT_SEO_DESCRIPTIONS = dict(
+            (lang_code, 'Registered description %s' % lang_code)
+            for lang_code in self.languages)
+
+        def metadatas():
+            for position in range(self.patterns):
+                yield SeoMetadata(
+                    lang_code=self.languages[position % len(self.languages)],
+                    path='/section-%d/{0}/' % position, has_parameters=True,
+                    priority=self.random.randint(0, 10),
+                    title='Section {0} %s' % self.placeholder,
+                    description='Section %d' % position)
+            article_ids = Article.objects.order_by('id').values_list(
+                'id', flat=True)
+            for article_id in article_ids.iterator():
+                for lang_code in self.languages:
+                    yield SeoMetadata(
+                        lang_code=lang_code, content_type=ctype,
+                        object_id=article_id,
+                        path='/%s/article/%d/' % (lang_code, article_id),
+                        title='Article %s' % self.placeholder,
+                        description='{name} %s' % self.placeholder)
+            for position in range(page_count):
+                translated = self.languages
+                if position % 2:
+                    translated = self.languages[:-1] or self.languages
+                for lang_code in translated:
+                    yield SeoMetadata(
+                        lang_code=lang_code, path='/page-%d/' % position,
+                        title='Page %d' % position,
+                        description='Page %d description' % position)
+
+        batch = []
+        for seometadata in metadatas():
+            batch.append(seometadata)
+            if len(batch) == BATCH_SIZE:
+                SeoMetadata.objects.bulk_create(batch)
+                batch = []
+        SeoMetadata.objects.bulk_create(batch)
+
+        SeoRegisteredModel.objects.bulk_create([
+            SeoRegisteredModel(
+                content_type=ctype, lang_code=lang_code,
+                title=Article.DEFAULT_SEO_TITLES[lang_code],
+                description=Article.DEFAULT_SEO_DESCRIPTIONS[lang_code])
+            for lang_code in self.languages])
+
+        self.rows = SeoMetadata.objects.count()
+        self.article_ids = list(Article.objects.values_list('id', flat=True))
+        self.page_count = page_count
+
+    def sample(self, count, build):
+        return [build(position) for position in range(count)]
+
+    def exact_calls(self, count):
+        return self.sample(count, lambda position: (
+            '/page-%d/' % self.random.randrange(self.page_count),
+            self.default_lang, None))
+
+    def language_calls(self, count):
+        # Odd pages are not translated to the last language
+        lang_code = self.languages[-1]
+        return self.sample(count, lambda position: (
+            '/page-%d/' % (self.random.randrange(self.page_count) | 1),
+            lang_code, None))
+
+    def instance_calls(self, count):
+        from benchapp.models import Article
+        calls = []
+        for position in range(count):
+            article = Article.objects.get(
+                pk=self.random.choice(self.article_ids))
+            calls.append(('/%s/article/%d/' % (self.default_lang, article.pk),
+                          self.default_lang, article))
+        return calls
+
+    def registered_calls(self, count):
+        # Instances without SeoMetadata for the requested path
+        calls = self.instance_calls(count)
+        return [('/unknown%s' % path, lang_code, article)
+                for path, lang_code, article in calls]
+
+    def pattern_calls(self, count):
+        return self.sample(count, lambda position: (
+            '/section-%d/slug-%d/' % (self.random.randrange(self.patterns),
+                                      position),
+            self.languages[position % len(self.languages)], None))
+
+    def fallback_calls(self, count):
+        return self.sample(count, lambda position: (
+            '/missing/%d/' % position, self.default_lang, None))
+
+
+class QueryCounter(object):
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def summarize(timings, queries):
+    timings = sorted(timings)
+    result = {
+        'calls': len(timings),
+        'mean_ms': sum(timings) / len(timings) * 1000,
+        'max_ms': timings[-1] * 1000,
+        'queries': queries,
+        'queries_per_call': float(queries) / len(timings),
+    }
+    for percentile in PERCENTILES:
+        position = min(int(round(percentile / 100.0 * len(timings))),
+                       len(timings)) - 1
+        result['p%d_ms' % percentile] = timings[max(position, 0)] * 1000
+    return result
+
+
+def clear_cached_results():
+    """
+    Empties the shared cache but keeps the versions, so the per process
+    indexes and snapshot built by the warmup stay valid.
+    """
+    from painlessseo.cache import (
+        METADATA_VERSION_KEY, MODELS_VERSION_KEY, get_seo_cache)
+
+    cache = get_seo_cache()
+    if cache is None:
+        return
+    versions = cache.get_many([METADATA_VERSION_KEY, MODELS_VERSION_KEY])
+    cache.clear()
+    cache.set_many(versions, None)
+
+
+def measure(function, calls, warmup_calls=None):
+    """
+    Calls function with every tuple of arguments in calls, returning the
+    latency percentiles and the number of queries done.
+
+    warmup_calls are made first, without being measured. Their results,
+    and the ones of previous scenarios, are then removed from the shared
+    cache, so it only answers the calls repeated within calls.
+    """
+    from django.db import connection
+
+    for args in warmup_calls or []:
+        function(*args)
+    clear_cached_results()
+
+    counter = QueryCounter()
+    timings = []
+    with connection.execute_wrapper(counter):
+        for args in calls:
+            start = time.perf_counter()
+            function(*args)
+            timings.append(time.perf_counter() - start)
+    return summarize(timings, counter.count)
+
+
+def measure_once(function):
+    from django.db import connection
+
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+    return summarize([elapsed], counter.count)
+
+
+def measure_memory(build, rows):
+    """
+    Returns the bytes allocated by build that are still alive after it
+    returns, in total and per SeoMetadata row.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        gc.collect()
+        allocated = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del kept
+    return {
+        'bytes': allocated,
+        'bytes_per_row': float(allocated) / max(rows, 1),
+    }
+
+
+def run_memory(dataset):
+    from painlessseo.models import RESOLVER_FIELDS, SeoMetadata
+    from painlessseo.records import get_metadata_records
+    from painlessseo.snapshot import ResolverSnapshot
+
+    metadatas = SeoMetadata.objects.order_by('id')
+    return {
+        'model_instances': measure_memory(lambda: list(
+            metadatas.only(*RESOLVER_FIELDS).iterator(chunk_size=BATCH_SIZE)),
+            dataset.rows),
+        'records': measure_memory(lambda: get_metadata_records(
+            metadatas, {}), dataset.rows),
+        'snapshot': measure_memory(lambda: ResolverSnapshot(None),
+                                   dataset.rows),
+    }
+
+
+def render_tag(template, path, lang_code, instance):
+    from types import SimpleNamespace
+    from django.template import Context
+    from django.test import RequestFactory
+    from django.utils import translation
+
+    request = RequestFactory().get(path)
+    with translation.override(lang_code):
+        return template.render(Context({
+            'request': request,
+            'view': SimpleNamespace(object=instance) if instance else None,
+        }))
+
+
+def run_dataset(rows, options):
+    from django.core.management import call_command
+    from django.template import Template
+    from painlessseo.utils import clear_seo_caches, get_path_metadata
+    from painlessseo.utils import update_seo
+    from painlessseo.routing import compile_routes
+    from benchapp.models import Article
+
+    start = time.perf_counter()
+    dataset = Dataset(rows, options)
+    if options.routing:
+        compile_routes(settings.SEO_ROUTING_FILE)
+    clear_seo_caches()
+    result = {
+        'rows': dataset.rows,
+        'build_seconds': time.perf_counter() - start,
+        'scenarios': {},
+    }
+    scenarios = result['scenarios']
+    samples = options.samples
+
+    def resolve(path, lang_code, instance):
+        return get_path_metadata(path, lang_code, instance=instance)
+
+    tiers = [
+        ('exact', dataset.exact_calls),
+        ('instance', dataset.instance_calls),
+        ('registered_model', dataset.registered_calls),
+        ('parameterized', dataset.pattern_calls),
+        ('fallback', dataset.fallback_calls),
+    ]
+    if len(dataset.languages) > 1:
+        tiers.insert(1, ('default_language', dataset.language_calls))
+
+    for name, build_calls in tiers:
+        # Built together, so the positional paths don't repeat
+        calls = build_calls(WARMUP_CALLS + samples)
+        scenarios['get_path_metadata.%s' % name] = measure(
+            resolve, calls[WARMUP_CALLS:], calls[:WARMUP_CALLS])
+
+    for tag in ['get_seo', 'get_seo_html']:
+        # New instances per tag, without the relations loaded by the
+        # previous one
+        warmup_calls = dataset.exact_calls(WARMUP_CALLS)
+        calls = dataset.exact_calls(samples // 2) + \
+            dataset.instance_calls(samples // 2)
+        template = Template('{%% load seo %%}{%% %s %%}' % tag)
+        scenarios['tag.%s' % tag] = measure(
+            lambda *args: render_tag(template, *args), calls, warmup_calls)
+
+    articles = list(Article.objects.filter(
+        pk__in=dataset.random.sample(dataset.article_ids, min(
+            samples, len(dataset.article_ids)))))
+    scenarios['update_seo'] = measure(
+        lambda article: update_seo(Article, article), [
+            (article, ) for article in articles])
+
+    scenarios['command.sync_seo_models'] = measure_once(
+        lambda: call_command('sync_seo_models', sync_instances=True,
+                             bulk=True))
+    scenarios['command.update_seo_content'] = measure_once(
+        lambda: call_command('update_seo_content'))
+
+    if options.memory:
+        result['memory'] = run_memory(dataset)
+    return result
+
+
+def print_results(results, previous=None):
+    previous_datasets = {}
+    previous_memory = {}
+    for dataset in (previous or {}).get('datasets', []):
+        previous_datasets[dataset['rows']] = dataset['scenarios']
+        previous_memory[dataset['rows']] = dataset.get('memory', {})
+
+    for dataset in results['datasets']:
+        print('%d rows (built in %.1fs)' % (dataset['rows'],
+                                            dataset['build_seconds']))
+        before = previous_datasets.get(dataset['rows'], {})
+        for name, stats in sorted(dataset['scenarios'].items()):
+            line = '  %-36s p50 %8.3fms  p99 %8.3fms  %6.2f queries' % (
+                name, stats['p50_ms'], stats['p99_ms'],
+                stats['queries_per_call'])
+            if name in before and before[name]['p50_ms']:
+                line += '  p50 x%.2f' % (
+                    stats['p50_ms'] / before[name]['p50_ms'])
+            print(line)
+
+        before = previous_memory.get(dataset['rows'], {})
+        for name, stats in sorted(dataset.get('memory', {}).items()):
+            line = '  %-36s %8.1fMB  %8.1f bytes per row' % (
+                'memory.%s' % name, stats['bytes'] / 1024.0 / 1024.0,
+                stats['bytes_per_row'])
+            if name in before and before[name]['bytes']:
+                line += '  x%.2f' % (
+                    float(stats['bytes']) / before[name]['bytes'])
+            print(line)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    database = options.database
+    if database is None:
+        handle, options.database = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+    configure(options)
+
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+    results = {
+        'label': options.label,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'options': {
+            'pattern_ratio': options.pattern_ratio,
+            'languages': options.languages,
+            'depth': options.depth,
+            'samples': options.samples,
+            'seed': options.seed,
+            'snapshot': options.snapshot,
+            'shared_cache': options.shared_cache,
+            'routing': options.routing,
+            'memory': options.memory,
+        },
+        'datasets': [],
+    }
+    try:
+        for rows in options.rows:
+            results['datasets'].append(run_dataset(rows, options))
+    finally:
+        if database is None:
+            os.remove(options.database)
+        if options.routing and os.path.exists(settings.SEO_ROUTING_FILE):
+            os.remove(settings.SEO_ROUTING_FILE)
+
+    previous = None
+    if options.compare:
+        with open(options.compare) as compare_file:
+            previous = json.load(compare_file)
+    print_results(results, previous)
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,9 @@ from __future__ import unicode_literals
 from django import forms
 from django.contrib import admin
 from django.core import exceptions
+from django.http import HttpResponseRedirect
+from django.template.response import TemplateResponse
+from django.urls import path
 from django.utils.translation import activate, get_language
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.forms import BaseGenericInlineFormSet
@@ -12,8 +15,9 @@ from django.contrib.contenttypes.admin import GenericTabularInline
 from django.forms import TextInput, Textarea
 from django.db import models
 
+from painlessseo import settings
 from painlessseo.models import SeoMetadata, SeoRegisteredModel
-from painlessseo.utils import register_seo_signals
+from painlessseo.stats import get_stats, reset_stats
 
 
 class ViewNameFilter(admin.SimpleListFilter):
@@ -179,5 +183,34 @@ class SeoMetadataAdmin(BaseModelAdmin):
         defaults.update(kwargs)
         return super(SeoMetadataAdmin, self).get_form(request, obj, **defaults)
 
+    def get_urls(self):
+        urls = super(SeoMetadataAdmin, self).get_urls()
+        return [
+            path('stats/', self.admin_site.admin_view(self.stats_view),
+                 name='painlessseo_seometadata_stats'),
+        ] + urls
 
-register_seo_signals()
+    def stats_view(self, request):
+        """
+        Shows the resolution counters of the process serving the request.
+        """
+        if not self.has_view_permission(request):
+            raise exceptions.PermissionDenied
+
+        can_reset = self.has_change_permission(request)
+        if request.method == 'POST':
+            if not can_reset:
+                raise exceptions.PermissionDenied
+            reset_stats()
+            return HttpResponseRedirect(request.path)
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title='SEO resolution stats',
+            opts=self.model._meta,
+            enabled=settings.SEO_STATS,
+            stats=get_stats(),
+            can_reset=can_reset,
+        )
+        return TemplateResponse(
+            request, 'admin/painlessseo/seometadata/stats.html', context)
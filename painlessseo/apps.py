@@ -0,0 +1,21 @@
+# Copyright (C) 2014 Glamping Hub (https://glampinghub.com)
+# License: BSD 3-Clause
+from __future__ import unicode_literals
+
+from django.apps import AppConfig
+
+
+class PainlessSeoConfig(AppConfig):
+    name = 'painlessseo'
+    default_auto_field = 'django.db.models.AutoField'
+    verbose_name = 'Painless SEO'
+
+    def ready(self):
+        from painlessseo import settings
+        # Fail on startup instead of on the first page without metadata
+        settings.FALLBACK_TITLE
+        settings.FALLBACK_DESCRIPTION
+
+        # Also connects the receivers keeping the caches up to date
+        from painlessseo.utils import register_seo_signals
+        register_seo_signals()
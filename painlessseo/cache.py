@@ -0,0 +1,285 @@
+# Copyright (C) 2014 Glamping Hub (https://glampinghub.com)
+# License: BSD 3-Clause
+from __future__ import unicode_literals
+
+import hashlib
+import time
+import uuid
+from collections import namedtuple
+
+from django.core.cache import caches
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.encoding import smart_str
+
+from painlessseo import settings
+from painlessseo.models import SeoMetadata, SeoRegisteredModel
+
+# Bumped when any SeoMetadata changes
+METADATA_VERSION_KEY = 'painlessseo:version'
+# Bumped when any SeoRegisteredModel changes
+MODELS_VERSION_KEY = 'painlessseo:models_version'
+# Changed when an instance of SEO_MODELS is saved, only invalidates the
+# resolutions using that instance. A random token, so an evicted version is
+# never reused.
+INSTANCE_VERSION_KEY = 'painlessseo:instance:%s'
+
+# Versions shared by all processes through SEO_CACHE_ALIAS. They are read
+# once per resolution and passed down to every per process cache.
+SeoVersions = namedtuple('SeoVersions', ['metadata', 'models', 'instance'])
+NO_VERSIONS = SeoVersions(None, None, None)
+
+
+def get_seo_cache():
+    """
+    Returns the cache configured through SEO_CACHE_ALIAS, or None.
+    """
+    if settings.SEO_CACHE_ALIAS is None:
+        return None
+    return caches[settings.SEO_CACHE_ALIAS]
+
+
+def get_new_version():
+    # Start from the current time so keys written with a previous, now
+    # evicted, version are never read again.
+    return int(time.time() * 1000)
+
+
+def get_new_instance_version():
+    return uuid.uuid4().hex
+
+
+def get_version_keys(instance=None):
+    keys = [METADATA_VERSION_KEY, MODELS_VERSION_KEY]
+    if instance is not None:
+        keys.append(INSTANCE_VERSION_KEY % get_instance_key(instance))
+    return keys
+
+
+def get_missing_versions(keys, found):
+    return [(key, get_new_instance_version() if index > 1
+             else get_new_version())
+            for index, key in enumerate(keys) if found.get(key) is None]
+
+
+def build_versions(keys, found, instance):
+    return SeoVersions(found[keys[0]], found[keys[1]],
+                       found[keys[2]] if instance is not None else None)
+
+
+def get_versions(instance=None, cache=None):
+    """
+    Returns the SeoVersions shared by all processes, with a single read from
+    the cache, or NO_VERSIONS if there is no cache configured.
+    """
+    cache = cache or get_seo_cache()
+    if cache is None:
+        return NO_VERSIONS
+
+    keys = get_version_keys(instance)
+    found = cache.get_many(keys)
+    for key, version in get_missing_versions(keys, found):
+        cache.add(key, version, None)
+        found[key] = cache.get(key)
+    return build_versions(keys, found, instance)
+
+
+async def aget_versions(instance=None, cache=None):
+    """
+    Same as get_versions, for async code.
+    """
+    cache = cache or get_seo_cache()
+    if cache is None:
+        return NO_VERSIONS
+
+    keys = get_version_keys(instance)
+    found = await cache.aget_many(keys)
+    for key, version in get_missing_versions(keys, found):
+        await cache.aadd(key, version, None)
+        found[key] = await cache.aget(key)
+    return build_versions(keys, found, instance)
+
+
+def get_instance_version_keys(instances):
+    return dict((get_instance_key(instance),
+                 INSTANCE_VERSION_KEY % get_instance_key(instance))
+                for instance in instances if instance is not None)
+
+
+def get_instance_versions(instances, cache):
+    """
+    Returns {instance key: version} for many instances, with a single read.
+    """
+    keys = get_instance_version_keys(instances)
+    found = cache.get_many(list(keys.values())) if keys else {}
+    for key in keys.values():
+        if found.get(key) is None:
+            cache.add(key, get_new_instance_version(), None)
+            found[key] = cache.get(key)
+    return dict((instance_key, found[key])
+                for instance_key, key in keys.items())
+
+
+async def aget_instance_versions(instances, cache):
+    """
+    Same as get_instance_versions, for async code.
+    """
+    keys = get_instance_version_keys(instances)
+    found = await cache.aget_many(list(keys.values())) if keys else {}
+    for key in keys.values():
+        if found.get(key) is None:
+            await cache.aadd(key, get_new_instance_version(), None)
+            found[key] = await cache.aget(key)
+    return dict((instance_key, found[key])
+                for instance_key, key in keys.items())
+
+
+def get_versioned_object(instance, content_object):
+    """
+    Returns the object a result was formatted with, when its version isn't
+    already part of the result key as the given instance, or None.
+    """
+    if content_object is None or \
+            get_instance_key(content_object) == get_instance_key(instance):
+        return None
+    return content_object
+
+
+def build_cache_entry(formatted_result, content_object, instance_versions):
+    """
+    Returns the value stored in the cache for a formatted result: the result
+    itself, and the INSTANCE_VERSION_KEY and version of the object it was
+    formatted with, from get_versioned_object.
+    """
+    if content_object is None:
+        return formatted_result, None, None
+    instance_key = get_instance_key(content_object)
+    return (formatted_result, INSTANCE_VERSION_KEY % instance_key,
+            instance_versions[instance_key])
+
+
+def get_entries_version_keys(entries):
+    return set(entry[1] for entry in entries
+               if entry is not None and entry[1] is not None)
+
+
+def get_fresh_result(entry, found):
+    """
+    Returns the formatted result of a cache entry, or None if there is none
+    or the object it was formatted with was saved since.
+    """
+    if entry is None:
+        return None
+    formatted_result, version_key, version = entry
+    if version_key is not None and found.get(version_key) != version:
+        return None
+    return formatted_result
+
+
+def get_cached_result(key, cache):
+    entry = cache.get(key)
+    version_keys = get_entries_version_keys([entry])
+    return get_fresh_result(
+        entry, cache.get_many(version_keys) if version_keys else {})
+
+
+async def aget_cached_result(key, cache):
+    """
+    Same as get_cached_result, for async code.
+    """
+    entry = await cache.aget(key)
+    version_keys = get_entries_version_keys([entry])
+    return get_fresh_result(
+        entry, await cache.aget_many(version_keys) if version_keys else {})
+
+
+def set_cached_result(key, formatted_result, instance, content_object,
+                      cache):
+    content_object = get_versioned_object(instance, content_object)
+    cache.set(key, build_cache_entry(
+        formatted_result, content_object,
+        get_instance_versions([content_object], cache)),
+        settings.SEO_CACHE_TIMEOUT)
+
+
+async def aset_cached_result(key, formatted_result, instance, content_object,
+                             cache):
+    """
+    Same as set_cached_result, for async code.
+    """
+    content_object = get_versioned_object(instance, content_object)
+    await cache.aset(key, build_cache_entry(
+        formatted_result, content_object,
+        await aget_instance_versions([content_object], cache)),
+        settings.SEO_CACHE_TIMEOUT)
+
+
+def bump_version(key):
+    cache = get_seo_cache()
+    if cache is None:
+        return
+
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, get_new_version(), None)
+
+
+@receiver(post_save, sender=SeoMetadata,
+          dispatch_uid='painlessseo_bump_version_metadata_save')
+@receiver(post_delete, sender=SeoMetadata,
+          dispatch_uid='painlessseo_bump_version_metadata_delete')
+def bump_metadata_version(**kwargs):
+    """
+    Invalidates every resolution stored in the cache, and the per process
+    copies of SeoMetadata in every process.
+    """
+    bump_version(METADATA_VERSION_KEY)
+
+
+@receiver(post_save, sender=SeoRegisteredModel,
+          dispatch_uid='painlessseo_bump_version_model_save')
+@receiver(post_delete, sender=SeoRegisteredModel,
+          dispatch_uid='painlessseo_bump_version_model_delete')
+def bump_models_version(**kwargs):
+    """
+    Same as bump_metadata_version, for SeoRegisteredModel.
+    """
+    bump_version(MODELS_VERSION_KEY)
+
+
+def bump_instance_versions(instances):
+    """
+    Invalidates the resolutions stored in the cache that used any of the
+    instances, whose fields may be used by their metadata.
+    """
+    cache = get_seo_cache()
+    if cache is None:
+        return
+
+    version = get_new_instance_version()
+    cache.set_many(dict(
+        (INSTANCE_VERSION_KEY % get_instance_key(instance), version)
+        for instance in instances), None)
+
+
+def get_instance_key(instance):
+    if instance is None:
+        return ''
+    return '%s.%s:%s' % (instance._meta.app_label, instance._meta.model_name,
+                         instance.pk)
+
+
+def get_metadata_key(path, lang_code, instance=None, seo_context=None,
+                     versions=NO_VERSIONS, instance_version=None):
+    identity = '\n'.join([
+        smart_str(lang_code),
+        smart_str(path),
+        get_instance_key(instance),
+        smart_str(sorted((seo_context or {}).items())),
+        ])
+    if instance_version is None:
+        instance_version = versions.instance
+    return 'painlessseo:%s.%s.%s:%s' % (
+        versions.metadata, versions.models, instance_version,
+        hashlib.md5(identity.encode('utf-8')).hexdigest())
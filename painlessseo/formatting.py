@@ -0,0 +1,247 @@
+# Copyright (C) 2014 Glamping Hub (https://glampinghub.com)
+# License: BSD 3-Clause
+from __future__ import unicode_literals
+
+from collections import namedtuple
+from functools import lru_cache
+
+from django.db.models import prefetch_related_objects
+from django.utils.encoding import smart_str
+
+import re
+
+PLACEHOLDER_RE = re.compile(r"\{\s*([^\}\s]+)\s*\}")
+
+# A '{ name }' occurrence inside a title or description. 'attrs' is the
+# name split by dots, and 'source' the original text, kept when the
+# placeholder can't be resolved.
+Placeholder = namedtuple('Placeholder', ['name', 'attrs', 'source'])
+
+
+@lru_cache(maxsize=1024)
+def parse_template(string):
+    """
+    Splits a title or description into a tuple of literal strings and
+    Placeholders. Results are cached by string.
+    """
+    tokens = []
+    position = 0
+    for match in PLACEHOLDER_RE.finditer(string):
+        if match.start() > position:
+            tokens.append(string[position:match.start()])
+        name = match.group(1)
+        tokens.append(Placeholder(name, tuple(name.split('.')),
+                                  match.group(0)))
+        position = match.end()
+    if position < len(string):
+        tokens.append(string[position:])
+    return tuple(tokens)
+
+
+def get_instance_value(instance, attrs, lang_code):
+    """
+    Follows attrs from the instance, using the 'attr_<lang_code>' version of
+    every attribute when it exists. Returns (found, value).
+    """
+    base = instance
+    attr_value = None
+    for attr in attrs:
+        field_lang = "%s_%s" % (attr, lang_code)
+        if hasattr(base, field_lang):
+            attr_name = field_lang
+        elif hasattr(base, attr):
+            attr_name = attr
+        elif base is None:
+            # In case is a foreign key with 'None' value
+            # We can't go deeper, but we found the attr
+            attr_value = None
+            break
+        else:
+            # Attr not found, so let it like it is
+            return False, None
+
+        attr_value = getattr(base, attr_name)
+        if hasattr(attr_value, 'all'):
+            # Related manager, reuse the prefetched objects if any
+            related = list(attr_value.all()[:2])
+            base = related[0] if len(related) == 1 else attr_value.get()
+        elif hasattr(attr_value, 'get'):
+            base = attr_value.get()
+        else:
+            base = attr_value
+    return True, attr_value
+
+
+@lru_cache(maxsize=None)
+def get_relation_fields(model):
+    """
+    Returns {accessor name: field} for every relation of the model.
+    """
+    fields = {}
+    for field in model._meta.get_fields():
+        if not field.is_relation or field.related_model is None:
+            continue
+        if field.auto_created and not field.concrete:
+            fields[field.get_accessor_name()] = field
+        else:
+            fields[field.name] = field
+    return fields
+
+
+@lru_cache(maxsize=1024)
+def get_template_plan(model, string, lang_code):
+    """
+    Returns the (select_related, prefetch_related) lookups needed to render
+    every placeholder of string for an instance of model.
+    """
+    select_related = set()
+    prefetch_related = set()
+    for token in parse_template(string):
+        if not isinstance(token, Placeholder):
+            continue
+
+        current = model
+        path = []
+        # Leading foreign keys, that can be joined in the same query
+        selected = 0
+        for attr in token.attrs:
+            fields = get_relation_fields(current)
+            field_lang = "%s_%s" % (attr, lang_code)
+            if field_lang in fields:
+                field = fields[field_lang]
+                path.append(field_lang)
+            elif attr in fields:
+                field = fields[attr]
+                path.append(attr)
+            else:
+                break
+
+            joinable = (field.many_to_one or field.one_to_one) and \
+                field.concrete
+            if joinable and selected == len(path) - 1:
+                selected = len(path)
+            current = field.related_model
+
+        if selected:
+            select_related.add('__'.join(path[:selected]))
+        if len(path) > selected:
+            prefetch_related.add('__'.join(path))
+
+    return tuple(sorted(select_related)), tuple(sorted(prefetch_related))
+
+
+def is_cached(instance, lookup):
+    base = instance
+    for name in lookup.split('__'):
+        field = get_relation_fields(type(base))[name]
+        if not field.is_cached(base):
+            return False
+        base = field.get_cached_value(base)
+        if base is None:
+            break
+    return True
+
+
+def prefetch_instance(instance, strings, lang_code):
+    """
+    Loads in advance the related objects used by the placeholders of all
+    strings, in a single query for the foreign keys and one more query per
+    reverse or many to many relation.
+    """
+    if instance is None or instance.pk is None:
+        return
+
+    model = type(instance)
+    select_related = set()
+    prefetch_related = set()
+    for string in strings:
+        if string:
+            selected, prefetched = get_template_plan(model, string, lang_code)
+            select_related.update(selected)
+            prefetch_related.update(prefetched)
+
+    select_related = [lookup for lookup in select_related
+                      if not is_cached(instance, lookup)]
+    if select_related:
+        # From the database the instance was loaded from, if it still exists
+        loaded = model._base_manager.using(instance._state.db).select_related(
+            *select_related).filter(pk=instance.pk).first()
+        if loaded is None:
+            return
+        fields = get_relation_fields(model)
+        for lookup in select_related:
+            field = fields[lookup.split('__')[0]]
+            field.set_cached_value(instance, field.get_cached_value(loaded))
+
+    if prefetch_related:
+        prefetch_related_objects([instance], *sorted(prefetch_related))
+
+
+def prefetch_instances_many(items):
+    """
+    Same as prefetch_instance for many (metadata, instance, lang_code)
+    tuples, with one query per model and relation.
+    """
+    lookups_by_model = {}
+    for metadata, instance, lang_code in items:
+        if instance is None or instance.pk is None or not lang_code:
+            continue
+        instances, lookups = lookups_by_model.setdefault(
+            type(instance), ({}, set()))
+        instances[id(instance)] = instance
+        for string in metadata.values():
+            if string:
+                selected, prefetched = get_template_plan(
+                    type(instance), string, lang_code)
+                lookups.update(selected)
+                lookups.update(prefetched)
+
+    for instances, lookups in lookups_by_model.values():
+        if lookups:
+            prefetch_related_objects(list(instances.values()),
+                                     *sorted(lookups))
+
+
+def render_template(string, instance=None, lang_code=None, params=None,
+                    values=None):
+    """
+    Replaces every placeholder in string, first by the instance attribute
+    with that name and otherwise by the de-slugified param. Placeholders
+    that can't be resolved are left like they are.
+
+    'values' can be given to share the resolved instance attributes among
+    several calls for the same instance.
+    """
+    if not string:
+        return string
+
+    tokens = parse_template(string)
+    if len(tokens) == 1 and not isinstance(tokens[0], Placeholder):
+        return string
+
+    if values is None:
+        values = {}
+    use_instance = bool(instance and lang_code)
+    output = []
+    for token in tokens:
+        if not isinstance(token, Placeholder):
+            output.append(token)
+            continue
+
+        if use_instance:
+            if token.name not in values:
+                found, value = get_instance_value(
+                    instance, token.attrs, lang_code)
+                values[token.name] = (str(value or '') if found else None)
+            if values[token.name] is not None:
+                output.append(values[token.name])
+                continue
+
+        if params and token.name in params:
+            # De-slugify
+            output.append(
+                smart_str(params[token.name]).replace('-', ' ').title())
+        else:
+            output.append(token.source)
+
+    return ''.join(output)
@@ -0,0 +1,256 @@
+# Copyright (C) 2014 Glamping Hub (https://glampinghub.com)
+# License: BSD 3-Clause
+from __future__ import unicode_literals
+
+import re
+import time
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from painlessseo import settings
+from painlessseo.cache import aget_versions, get_versions
+from painlessseo.models import (
+    PARAMETER_RE, REGEX_CHARS_RE, SeoMetadata, SeoRegisteredModel)
+from painlessseo.records import (
+    aget_metadata_records, aget_registered_model_records,
+    get_metadata_records, get_registered_model_records)
+
+# Cached indexes per language:
+# {lang_code: (built_at, metadata version, PatternIndex)}
+_indexes = {}
+# Cached SeoRegisteredModel per model and language:
+# {(content_type_id, lang_code):
+#  (built_at, models version, [RegisteredModelRecord])}
+_pools = {}
+
+
+def get_path_regex(path):
+    regex_path = re.sub(r'\{\d+\}', r'([^/]+)', path)
+    return '^' + regex_path + '$'
+
+
+def get_candidate_prefixes(path):
+    """
+    Returns every literal_prefix a parameterized path matching path can
+    have.
+    """
+    prefixes = ['']
+    position = path.find('/')
+    while position != -1:
+        prefixes.append(path[:position + 1])
+        position = path.find('/', position + 1)
+    return prefixes
+
+
+def get_candidate_metadatas(lang_code, path):
+    """
+    Returns the parameterized SeoMetadata of lang_code that could match
+    path, using their literal_prefix. Only used with SEO_INDEX_TIMEOUT = 0,
+    when there is no per process index. The snapshot and the routing file
+    keep every pattern in memory, so they don't need it either.
+    """
+    return SeoMetadata.objects.filter(
+        has_parameters=True, lang_code=lang_code,
+        literal_prefix__in=get_candidate_prefixes(path)).order_by()
+
+
+class PatternNode(object):
+    __slots__ = ('literals', 'wildcard', 'partials', 'entries')
+
+    def __init__(self):
+        # Segments without parameters: {segment: node}
+        self.literals = {}
+        # Segment that is a single parameter, e.g. '{0}'
+        self.wildcard = None
+        # Segments mixing text and parameters, e.g. 'page-{0}':
+        # {segment: (compiled regex, node)}
+        self.partials = {}
+        self.entries = []
+
+
+class PatternIndex(object):
+    """
+    Segment trie over parameterized SeoMetadata paths.
+
+    Every path segment is either a literal edge, a '{N}' wildcard edge or,
+    when it mixes text and parameters, a per segment regex edge. Matching
+    walks the path once, so its cost depends on the path depth instead of
+    on the number of patterns. Paths containing other regex characters are
+    kept apart and matched with the plain regex, as before.
+    """
+
+    def __init__(self, metadatas=()):
+        self.root = PatternNode()
+        self.irregular = []
+        for seometadata in metadatas:
+            self.add(seometadata)
+
+    def add(self, seometadata):
+        path = seometadata.path
+        if path is None:
+            return
+
+        if REGEX_CHARS_RE.search(PARAMETER_RE.sub('', path)):
+            self.irregular.append(
+                (re.compile(get_path_regex(path)), seometadata))
+            return
+
+        node = self.root
+        for segment in path.split('/'):
+            if PARAMETER_RE.fullmatch(segment):
+                if node.wildcard is None:
+                    node.wildcard = PatternNode()
+                node = node.wildcard
+            elif PARAMETER_RE.search(segment):
+                if segment not in node.partials:
+                    node.partials[segment] = (
+                        re.compile(get_path_regex(segment)), PatternNode())
+                node = node.partials[segment][1]
+            else:
+                node = node.literals.setdefault(segment, PatternNode())
+        node.entries.append(seometadata)
+
+    def match(self, path, min_priority=0):
+        """
+        Returns the list of {'seometadata', 'groups'} matching the path with
+        priority >= min_priority, higher priorities first.
+        """
+        found = []
+        segments = path.split('/')
+        depth = len(segments)
+        stack = [(self.root, 0, ())]
+        while stack:
+            node, position, groups = stack.pop()
+            if position == depth:
+                for seometadata in node.entries:
+                    found.append((seometadata, groups))
+                continue
+
+            segment = segments[position]
+            child = node.literals.get(segment)
+            if child is not None:
+                stack.append((child, position + 1, groups))
+            if segment and node.wildcard is not None:
+                stack.append((node.wildcard, position + 1,
+                              groups + (segment, )))
+            for regex, child in node.partials.values():
+                segment_match = regex.match(segment)
+                if segment_match:
+                    stack.append((child, position + 1,
+                                  groups + segment_match.groups()))
+
+        for regex, seometadata in self.irregular:
+            path_match = regex.search(path)
+            if path_match:
+                found.append((seometadata, path_match.groups()))
+
+        found = [item for item in found if item[0].priority >= min_priority]
+        found.sort(key=lambda item: (-item[0].priority, item[0].id))
+        return [{
+            'seometadata': seometadata,
+            'groups': groups,
+            } for seometadata, groups in found]
+
+
+def is_fresh(cached, version):
+    timeout = settings.SEO_INDEX_TIMEOUT
+    return cached is not None and cached[1] == version and (
+        timeout is None or time.time() - cached[0] < timeout)
+
+
+def get_pattern_index(lang_code, path=None, versions=None):
+    """
+    Returns the PatternIndex of the language. With SEO_INDEX_TIMEOUT = 0
+    there is no per process index, and when the path is given only the
+    patterns that could match it are loaded.
+
+    versions are the SeoVersions already read for the current resolution,
+    if any.
+    """
+    if path is not None and settings.SEO_INDEX_TIMEOUT == 0:
+        return PatternIndex(get_metadata_records(
+            get_candidate_metadatas(lang_code, path)))
+
+    cached = _indexes.get(lang_code)
+    version = (versions or get_versions()).metadata
+    if is_fresh(cached, version):
+        return cached[2]
+
+    metadatas = SeoMetadata.objects.filter(
+        has_parameters=True, lang_code=lang_code).order_by()
+    pattern_index = PatternIndex(get_metadata_records(metadatas, {}))
+    _indexes[lang_code] = (time.time(), version, pattern_index)
+    return pattern_index
+
+
+def get_registered_pool(content_type_id, lang_code, versions=None):
+    """
+    Returns the RegisteredModelRecord list for a model and language, by
+    id.
+    """
+    key = (content_type_id, lang_code)
+    cached = _pools.get(key)
+    version = (versions or get_versions()).models
+    if is_fresh(cached, version):
+        return cached[2]
+
+    pool = get_registered_model_records(SeoRegisteredModel.objects.filter(
+        content_type_id=content_type_id, lang_code=lang_code).order_by('id'),
+        {})
+    _pools[key] = (time.time(), version, pool)
+    return pool
+
+
+async def aget_pattern_index(lang_code, path=None, versions=None):
+    """
+    Same as get_pattern_index, for async code.
+    """
+    if path is not None and settings.SEO_INDEX_TIMEOUT == 0:
+        return PatternIndex(await aget_metadata_records(
+            get_candidate_metadatas(lang_code, path)))
+
+    cached = _indexes.get(lang_code)
+    version = (versions or await aget_versions()).metadata
+    if is_fresh(cached, version):
+        return cached[2]
+
+    metadatas = SeoMetadata.objects.filter(
+        has_parameters=True, lang_code=lang_code).order_by()
+    pattern_index = PatternIndex(await aget_metadata_records(metadatas, {}))
+    _indexes[lang_code] = (time.time(), version, pattern_index)
+    return pattern_index
+
+
+async def aget_registered_pool(content_type_id, lang_code, versions=None):
+    """
+    Same as get_registered_pool, for async code.
+    """
+    key = (content_type_id, lang_code)
+    cached = _pools.get(key)
+    version = (versions or await aget_versions()).models
+    if is_fresh(cached, version):
+        return cached[2]
+
+    pool = await aget_registered_model_records(
+        SeoRegisteredModel.objects.filter(
+            content_type_id=content_type_id,
+            lang_code=lang_code).order_by('id'), {})
+    _pools[key] = (time.time(), version, pool)
+    return pool
+
+
+@receiver(post_save, sender=SeoMetadata,
+          dispatch_uid='painlessseo_clear_pattern_indexes_save')
+@receiver(post_delete, sender=SeoMetadata,
+          dispatch_uid='painlessseo_clear_pattern_indexes_delete')
+def clear_pattern_indexes(**kwargs):
+    _indexes.clear()
+
+
+@receiver(post_save, sender=SeoRegisteredModel,
+          dispatch_uid='painlessseo_clear_registered_pools_save')
+@receiver(post_delete, sender=SeoRegisteredModel,
+          dispatch_uid='painlessseo_clear_registered_pools_delete')
+def clear_registered_pools(**kwargs):
+    _pools.clear()
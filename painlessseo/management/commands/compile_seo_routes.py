@@ -0,0 +1,46 @@
+"""
+compile_seo_routes.py
+
+    Writes every SeoMetadata and SeoRegisteredModel to the routing file
+    shared by all the processes of a host.
+
+"""
+from __future__ import unicode_literals
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from painlessseo import settings
+from painlessseo.routing import compile_routes
+from painlessseo.utils import clear_seo_caches
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = '''Compile the SEO info into the routing file. '''
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', dest='output', default=None,
+            help='File to write to, SEO_ROUTING_FILE by default')
+        parser.add_argument(
+            '--chunk-size', dest='chunk_size', type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='Number of rows read from the database at once')
+
+    def handle(self, **options):
+        filename = options.get('output') or settings.SEO_ROUTING_FILE
+        if not filename:
+            raise CommandError('Use --output or define SEO_ROUTING_FILE in \
+                               settings.')
+
+        start = time.time()
+        records, size = compile_routes(filename,
+                                       chunk_size=options.get('chunk_size'))
+        # Every process opens the new file, and drops what it resolved
+        # from the previous one
+        clear_seo_caches()
+        print("%d metadatas compiled into %s (%d bytes) in %.1fs" % (
+            records, filename, size, time.time() - start))
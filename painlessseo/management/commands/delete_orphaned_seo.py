@@ -0,0 +1,41 @@
+"""
+delete_orphaned_seo.py
+
+    Deletes the SeoMetadata of registered models whose object doesn't exist
+    anymore.
+
+"""
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.contrib.contenttypes.models import ContentType
+
+from painlessseo import settings
+from painlessseo.utils import delete_orphaned_seo
+
+DEFAULT_SEO_MODELS = settings.SEO_MODELS
+
+
+class Command(BaseCommand):
+    help = '''Delete the SEO info of registered models instances that no \
+            longer exist. '''
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--models', dest='seo_models', default=DEFAULT_SEO_MODELS,
+            help='Use this to indicate which apps must be cleaned')
+
+    def handle(self, **options):
+        seo_models = options.get('seo_models')
+        if isinstance(seo_models, str):
+            models = seo_models.split(' ')
+            seo_models = []
+            for model in models:
+                seo_models.append(model.split('.'))
+
+        for app, model in seo_models:
+            ctype = ContentType.objects.get(app_label=app.lower(),
+                                            model=model.lower())
+            count = delete_orphaned_seo(ctype.model_class())
+            print("%d orphaned metadatas deleted for %s in app %s" % (
+                count, model, app))
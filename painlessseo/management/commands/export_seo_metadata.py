@@ -0,0 +1,70 @@
+"""
+export_seo_metadata.py
+
+    Writes the resolved title and description of every SEO path, in JSON
+    lines or CSV format.
+
+"""
+from __future__ import unicode_literals
+
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from painlessseo.models import SeoMetadata
+from painlessseo.utils import iter_resolved_metadata
+
+DEFAULT_FORMAT = 'jsonl'
+DEFAULT_CHUNK_SIZE = 2000
+FIELDS = ['path', 'lang_code', 'title', 'description']
+
+
+class Command(BaseCommand):
+    help = '''Export the resolved SEO info of every path. '''
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format', dest='format', default=DEFAULT_FORMAT,
+            help='Output format, jsonl or csv')
+        parser.add_argument(
+            '--output', dest='output', default=None,
+            help='File to write to, stdout by default')
+        parser.add_argument(
+            '--langs', dest='export_langs', default=None,
+            help='Use this to indicate which languages must be exported')
+        parser.add_argument(
+            '--chunk-size', dest='chunk_size', type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='Number of rows read from the database at once')
+
+    def handle(self, **options):
+        output_format = options.get('format')
+        if output_format not in ('jsonl', 'csv'):
+            raise CommandError("Unknown format '%s'." % output_format)
+
+        metadatas = SeoMetadata.objects.filter(has_parameters=False)
+        export_langs = options.get('export_langs')
+        if export_langs:
+            metadatas = metadatas.filter(lang_code__in=export_langs.split(' '))
+
+        output = self.stdout
+        if options.get('output'):
+            output = open(options.get('output'), 'w', newline='',
+                          encoding='utf-8')
+
+        try:
+            if output_format == 'csv':
+                writer = csv.DictWriter(output, fieldnames=FIELDS)
+                writer.writeheader()
+                write = writer.writerow
+            else:
+                def write(row):
+                    output.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+            for row in iter_resolved_metadata(
+                    metadatas, chunk_size=options.get('chunk_size')):
+                write(row)
+        finally:
+            if output is not self.stdout:
+                output.close()
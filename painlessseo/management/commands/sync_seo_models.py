@@ -6,37 +6,63 @@ sync_seo_models.py
 """
 from __future__ import unicode_literals
 
-from optparse import make_option
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
+import time
 
+import django
+from django.apps import apps
+from django.db import connections, router
+from django.db.models import Max, Min
 from django.core.exceptions import ImproperlyConfigured
-from django.core.management.base import NoArgsCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.contenttypes.models import ContentType
 
 from painlessseo import settings
-from painlessseo.utils import update_seo
-from painlessseo.models import SeoRegisteredModel
+from painlessseo.utils import bulk_update_seo, clear_seo_caches, update_seo
+from painlessseo.models import SeoMetadata, SeoRegisteredModel
 
 DEFAULT_CREATE_LANG = []
 DEFAULT_SEO_MODELS = settings.SEO_MODELS
+DEFAULT_CHUNK_SIZE = 2000
 
 
-class Command(NoArgsCommand):
-    option_list = NoArgsCommand.option_list + (
-        make_option('--langs', dest='update_langs',
-                    default=DEFAULT_CREATE_LANG,
-                    help='Use this to indicate which languages must be \
-                    generated'),
-        make_option('--models', dest='seo_models', default=DEFAULT_SEO_MODELS,
-                    help='Use this to indicate which apps must be updated'),
-        make_option('--sync-instances', dest='sync_instances', default=False,
-                    help='Use this to indicate if instances must be synced'),
-
-    )
+class Command(BaseCommand):
     help = '''DEBUG only: Sync the SEO info in the database for registered \
             models. '''
-    requires_model_validation = True
 
-    def handle_noargs(self, **options):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--langs', dest='update_langs', default=DEFAULT_CREATE_LANG,
+            help='Use this to indicate which languages must be generated')
+        parser.add_argument(
+            '--models', dest='seo_models', default=DEFAULT_SEO_MODELS,
+            help='Use this to indicate which apps must be updated')
+        parser.add_argument(
+            '--sync-instances', dest='sync_instances', default=False,
+            help='Use this to indicate if instances must be synced')
+        parser.add_argument(
+            '--bulk', dest='bulk', action='store_true', default=False,
+            help='Sync instances in chunks using bulk queries')
+        parser.add_argument(
+            '--chunk-size', dest='chunk_size', type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='Number of instances synced at once in bulk mode')
+        parser.add_argument(
+            '--workers', dest='workers', type=int, default=1,
+            help='Number of processes syncing instances in bulk mode in '
+            'parallel. Not supported on SQLite, which locks the whole '
+            'database on every write')
+
+    def handle(self, **options):
+        database = router.db_for_write(SeoMetadata)
+        if options.get('workers') > 1 and \
+                connections[database].vendor == 'sqlite':
+            raise CommandError(
+                "--workers can't be used with SQLite, the workers would "
+                "block each other.")
+
+        failed = []
         seo_models = options.get('seo_models')
         if isinstance(seo_models, str):
             models = seo_models.split(' ')
@@ -60,7 +86,7 @@ class Command(NoArgsCommand):
                                 not defined on %s.%s model." % (app, model))
             model_class = ctype.model_class()
 
-            print("Registering %s model in app %s") % (model, app)
+            print("Registering %s model in app %s" % (model, app))
             for lang_code, language in languages:
                 model_metadata = get_hardcoded_metadata(model_class, lang_code)
                 titles = model_metadata['titles']
@@ -76,16 +102,136 @@ class Command(NoArgsCommand):
                         description=desc,
                         )
                     if created:
-                        print("   - Lang '%s' updated.") % (lang_code)
+                        print("   - Lang '%s' updated." % (lang_code))
 
             if options.get('sync_instances'):
-                print("Updating %s instances in app %s") % (model, app)
-                objs = list(model_class.objects.all())
-                for obj in objs:
-                    update_seo(model_class, obj, auto_languages=update_langs,
-                               weak=True)
-                count = model_class.objects.count()
-                print("%d %s updated on app %s") % (count, model, app)
+                print("Updating %s instances in app %s" % (model, app))
+                if options.get('workers') > 1:
+                    failed += sync_instances_parallel(
+                        model_class, update_langs, options.get('chunk_size'),
+                        options.get('workers'))
+                elif options.get('bulk'):
+                    start = time.time()
+                    result = sync_instances_bulk(model_class, update_langs,
+                                                 options.get('chunk_size'))
+                    print_throughput(model_class, result, start)
+                else:
+                    objs = list(model_class.objects.all())
+                    for obj in objs:
+                        update_seo(model_class, obj,
+                                   auto_languages=update_langs, weak=True)
+                    count = model_class.objects.count()
+                    print("%d %s updated on app %s" % (count, model, app))
+
+        clear_seo_caches()
+        if failed:
+            raise CommandError(
+                "%d shards failed, run the command again to sync them."
+                % len(failed))
+
+
+def sync_instances_bulk(model_class, update_langs, chunk_size,
+                        queryset=None, languages=None):
+    """
+    Streams the instances of model_class and syncs their SeoMetadata in
+    chunks of chunk_size. Returns a (count, created, updated) tuple.
+    """
+    if queryset is None:
+        queryset = model_class.objects.all()
+    objs = queryset.order_by('pk').iterator(chunk_size=chunk_size)
+
+    count = created = updated = 0
+    while True:
+        chunk = list(islice(objs, chunk_size))
+        if not chunk:
+            break
+        chunk_created, chunk_updated = bulk_update_seo(
+            model_class, chunk, auto_languages=update_langs,
+            languages=languages)
+        count += len(chunk)
+        created += chunk_created
+        updated += chunk_updated
+
+    return count, created, updated
+
+
+def sync_shard(app_label, model_name, update_langs, chunk_size, lang_code,
+               min_pk, max_pk):
+    """
+    Syncs the instances of a model with min_pk <= pk <= max_pk for a single
+    language. Runs inside the worker processes.
+    """
+    model_class = apps.get_model(app_label, model_name)
+    queryset = model_class.objects.all()
+    if min_pk is not None:
+        queryset = queryset.filter(pk__gte=min_pk, pk__lte=max_pk)
+    try:
+        return sync_instances_bulk(model_class, update_langs, chunk_size,
+                                   queryset=queryset, languages=[lang_code])
+    finally:
+        connections.close_all()
+
+
+def sync_instances_parallel(model_class, update_langs, chunk_size, workers):
+    """
+    Splits the sync of model_class by language and primary key range among
+    a pool of worker processes. Every shard writes a different set of
+    SeoMetadata rows, so the result is the same as a serial run.
+
+    A failing shard doesn't stop the rest. They are reported, and returned
+    as a list of (lang_code, min_pk, max_pk, exception) tuples.
+    """
+    start = time.time()
+    bounds = model_class.objects.aggregate(min_pk=Min('pk'), max_pk=Max('pk'))
+    min_pk, max_pk = bounds['min_pk'], bounds['max_pk']
+    if min_pk is None:
+        ranges = []
+    elif isinstance(min_pk, int):
+        step = (max_pk - min_pk) // workers + 1
+        ranges = [(low, min(low + step - 1, max_pk))
+                  for low in range(min_pk, max_pk + 1, step)]
+    else:
+        # Non integer keys can't be split, shard by language only
+        ranges = [(None, None)]
+
+    # Workers must open their own connections instead of sharing ours
+    connections.close_all()
+    count = created = updated = 0
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=django.setup) as executor:
+        futures = dict(
+            (executor.submit(sync_shard, model_class._meta.app_label,
+                             model_class._meta.model_name, update_langs,
+                             chunk_size, lang_code, low, high),
+             (lang_code, low, high))
+            for lang_code, language in settings.SEO_LANGUAGES
+            for low, high in ranges)
+        for future in as_completed(futures):
+            try:
+                shard_count, shard_created, shard_updated = future.result()
+            except Exception as e:
+                lang_code, low, high = futures[future]
+                print("   - Lang '%s', pk %s to %s failed: %r" % (
+                    lang_code, low, high, e))
+                failed.append((lang_code, low, high, e))
+                continue
+            count += shard_count
+            created += shard_created
+            updated += shard_updated
+
+    # Every instance was counted once per language
+    count //= max(len(settings.SEO_LANGUAGES), 1)
+    print_throughput(model_class, (count, created, updated), start)
+    return failed
+
+
+def print_throughput(model_class, result, start):
+    count, created, updated = result
+    elapsed = time.time() - start
+    print("%d %s synced in %.1fs (%.0f/s): %d created, %d updated" % (
+        count, model_class._meta.model_name, elapsed,
+        count / elapsed if elapsed else 0, created, updated))
 
 
 def get_hardcoded_metadata(cls, lang_code):
@@ -6,32 +6,32 @@ sync_seo_models.py
 """
 from __future__ import unicode_literals
 
-from optparse import make_option
 
-from django.core.management.base import NoArgsCommand
+from django.core.management.base import BaseCommand
 from django.contrib.contenttypes.models import ContentType
 
 from painlessseo import settings
 from painlessseo.models import SeoRegisteredModel, SeoMetadata
+from painlessseo.utils import clear_seo_caches
 
 DEFAULT_CREATE_LANG = []
 DEFAULT_SEO_MODELS = settings.SEO_MODELS
+BATCH_SIZE = 1000
 
 
-class Command(NoArgsCommand):
-    option_list = NoArgsCommand.option_list + (
-        make_option('--langs', dest='update_langs',
-                    default=DEFAULT_CREATE_LANG,
-                    help='Use this to indicate which languages must be \
-                    generated'),
-        make_option('--models', dest='seo_models', default=DEFAULT_SEO_MODELS,
-                    help='Use this to indicate which apps must be updated'),
-    )
+class Command(BaseCommand):
     help = '''DEBUG only: Sync the SEO info in the database for registered \
             models. '''
-    requires_model_validation = True
 
-    def handle_noargs(self, **options):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--langs', dest='update_langs', default=DEFAULT_CREATE_LANG,
+            help='Use this to indicate which languages must be generated')
+        parser.add_argument(
+            '--models', dest='seo_models', default=DEFAULT_SEO_MODELS,
+            help='Use this to indicate which apps must be updated')
+
+    def handle(self, **options):
         seo_models = options.get('seo_models')
         if isinstance(seo_models, str):
             models = seo_models.split(' ')
@@ -48,48 +48,58 @@ class Command(NoArgsCommand):
         languages = settings.SEO_LANGUAGES
         base_lang = settings.DEFAULT_LANG_CODE
 
-        # Update SeoPath
+        # Update SeoPath. When several base metadatas share a view, the
+        # first one in the Meta ordering is copied.
         metadatas = SeoMetadata.objects.filter(
             lang_code=base_lang, content_type__isnull=True)
+        existing = set(SeoMetadata.objects.filter(
+            view_name__isnull=False).values_list('view_name', 'lang_code'))
 
-        count = 0
-        for metadata in list(metadatas):
+        new_metadatas = []
+        for metadata in metadatas.iterator():
             # Each metadata, sync it for the rest of the languages
             view_name = metadata.view_name
             if view_name:
                 for lang_code, language in languages:
                     # If not exists a metadata on this lang for this view
-                    if not SeoMetadata.objects.filter(
-                            lang_code=lang_code, view_name=view_name).exists():
-                        SeoMetadata.objects.create(
+                    if (view_name, lang_code) not in existing:
+                        existing.add((view_name, lang_code))
+                        new_metadatas.append(SeoMetadata(
                             lang_code=lang_code, view_name=view_name,
                             description=metadata.description,
                             title=metadata.title,
                             has_parameters=metadata.has_parameters,
                             path=metadata.path,
-                            )
-                        count += 1
+                            literal_prefix=metadata.literal_prefix,
+                            ))
 
-        print(str(count) + " metadatas created.")
+        SeoMetadata.objects.bulk_create(new_metadatas, batch_size=BATCH_SIZE)
+        print(str(len(new_metadatas)) + " metadatas created.")
 
         # Update SeoModels
-        count = 0
-        for app, model in seo_models:
-            ctype = ContentType.objects.get(app_label=app.lower(),
-                                            model=model.lower())
-            seomodels = SeoRegisteredModel.objects.filter(
-                lang_code=base_lang, content_type=ctype)
-            if seomodels.exists():
-                for seomodel in seomodels:
-                    for lang_code, language in languages:
-                        # If not exists a metadata on this lang for this model
-                        if not SeoRegisteredModel.objects.filter(
-                                lang_code=lang_code,
-                                content_type=ctype).exists():
-                            SeoRegisteredModel.objects.create(
-                                lang_code=lang_code, content_type=ctype,
-                                title=seomodel.title,
-                                description=seomodel.description)
-                            count += 1
-
-        print(str(count) + " seomodels created.")
+        ctypes = [ContentType.objects.get_by_natural_key(app.lower(),
+                                                         model.lower())
+                  for app, model in seo_models]
+        seomodels = SeoRegisteredModel.objects.filter(
+            lang_code=base_lang, content_type__in=ctypes).order_by('id')
+        existing = set(SeoRegisteredModel.objects.filter(
+            content_type__in=ctypes).values_list('content_type_id',
+                                                 'lang_code'))
+
+        new_seomodels = []
+        for seomodel in seomodels:
+            for lang_code, language in languages:
+                # If not exists a metadata on this lang for this model
+                if (seomodel.content_type_id, lang_code) not in existing:
+                    existing.add((seomodel.content_type_id, lang_code))
+                    new_seomodels.append(SeoRegisteredModel(
+                        lang_code=lang_code,
+                        content_type_id=seomodel.content_type_id,
+                        title=seomodel.title,
+                        description=seomodel.description))
+
+        SeoRegisteredModel.objects.bulk_create(new_seomodels,
+                                               batch_size=BATCH_SIZE)
+        print(str(len(new_seomodels)) + " seomodels created.")
+
+        clear_seo_caches()
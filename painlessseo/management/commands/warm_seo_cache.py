@@ -0,0 +1,160 @@
+"""
+warm_seo_cache.py
+
+    Resolves the most requested paths of an access log, or of a list of
+    paths, into the SEO_CACHE_ALIAS cache.
+
+"""
+from __future__ import unicode_literals
+
+from collections import Counter
+from urllib.parse import urlparse
+import re
+import sys
+import time
+
+from django.apps import apps
+from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
+from django.core.management.base import BaseCommand, CommandError
+from django.http import Http404
+from django.test import RequestFactory
+from django.urls import Resolver404, resolve
+from django.utils import translation
+
+from painlessseo import settings
+from painlessseo.cache import get_seo_cache
+from painlessseo.templatetags.seo import get_view_seo
+from painlessseo.utils import get_path_metadata_many
+
+DEFAULT_TOP = 1000
+DEFAULT_BATCH_SIZE = 500
+
+# Request and status of a line in common or combined log format
+LOG_LINE_RE = re.compile(
+    r'"(?P<method>[A-Z]+) (?P<path>\S+)(?: [^"]*)?" (?P<status>\d{3}) ')
+
+
+def read_paths(lines):
+    """
+    Yields the paths of successful GET requests of an access log, or every
+    line of a list of paths, optionally followed by their language code.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        log_match = LOG_LINE_RE.search(line)
+        if log_match:
+            if log_match.group('method') in ('GET', 'HEAD') and \
+                    log_match.group('status').startswith('2'):
+                yield log_match.group('path'), None
+        elif line.startswith('/'):
+            parts = line.split()
+            yield parts[0], parts[1] if len(parts) > 1 else None
+
+
+def get_view_item(path, lang_code):
+    """
+    Returns the (path, lang_code, instance, seo_context) the SEO template
+    tags would use for the path, calling its class based view if any.
+    """
+    with translation.override(lang_code):
+        try:
+            match = resolve(path)
+        except Resolver404:
+            return path, lang_code, None, {}
+
+        view_class = getattr(match.func, 'view_class', None)
+        if view_class is None:
+            return path, lang_code, None, {}
+
+        request = RequestFactory().get(path)
+        if apps.is_installed('django.contrib.auth'):
+            # Like the request of a visitor that isn't logged in
+            from django.contrib.auth.models import AnonymousUser
+            request.user = AnonymousUser()
+        view = view_class(**match.func.view_initkwargs)
+        view.setup(request, *match.args, **match.kwargs)
+        try:
+            instance, seo_context = get_view_seo(view)
+        except (Http404, ObjectDoesNotExist, PermissionDenied):
+            instance, seo_context = None, {}
+    return path, lang_code, instance, seo_context
+
+
+class Command(BaseCommand):
+    help = '''Resolve the most requested paths into the SEO cache. '''
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--input', dest='input', default='-',
+            help='Access log or list of paths, stdin by default')
+        parser.add_argument(
+            '--top', dest='top', type=int, default=DEFAULT_TOP,
+            help='Number of most requested paths to resolve')
+        parser.add_argument(
+            '--batch-size', dest='batch_size', type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Number of paths resolved at once')
+        parser.add_argument(
+            '--resolve-views', dest='resolve_views', action='store_true',
+            default=True,
+            help='Use the object and seo context of the class based view of '
+            'every path, like the template tags do. The default')
+        parser.add_argument(
+            '--no-resolve-views', dest='resolve_views', action='store_false',
+            help='Resolve every path without an object nor seo context, '
+            'faster but only useful for pages whose template tags are used '
+            'without them')
+
+    def handle(self, **options):
+        if get_seo_cache() is None:
+            raise CommandError('SEO_CACHE_ALIAS is not defined in settings, \
+                               there is no cache to warm.')
+
+        start = time.time()
+        input_file = sys.stdin
+        if options.get('input') != '-':
+            input_file = open(options.get('input'), encoding='utf-8',
+                              errors='replace')
+
+        languages = set(lang_code for lang_code, language in
+                        settings.SEO_LANGUAGES)
+        counter = Counter()
+        try:
+            for path, lang_code in read_paths(input_file):
+                path = urlparse(path).path
+                if lang_code is None:
+                    lang_code = (translation.get_language_from_path(path) or
+                                 settings.DEFAULT_LANG_CODE)[:2]
+                if lang_code in languages:
+                    counter[(path, lang_code)] += 1
+        finally:
+            if input_file is not sys.stdin:
+                input_file.close()
+
+        keys = [key for key, count in counter.most_common(options.get('top'))]
+        batch_size = options.get('batch_size')
+        failed = 0
+        for position in range(0, len(keys), batch_size):
+            batch = keys[position:position + batch_size]
+            items = []
+            for path, lang_code in batch:
+                if not options.get('resolve_views'):
+                    items.append((path, lang_code, None))
+                    continue
+                try:
+                    items.append(get_view_item(path, lang_code))
+                except Exception as e:
+                    # Still warmed, like a page without object nor context
+                    print("   - View of %s (%s) failed: %r" % (
+                        path, lang_code, e))
+                    failed += 1
+                    items.append((path, lang_code, None, {}))
+            get_path_metadata_many(items)
+
+        print("%d paths warmed, out of %d different ones, in %.1fs" % (
+            len(keys), len(counter), time.time() - start))
+        if failed:
+            print("%d of them without their view, that failed." % failed)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import re
+
+from django.db import migrations, models
+
+PARAMETER_RE = re.compile(r'\{\d+\}')
+REGEX_CHARS_RE = re.compile(r'[.^$*+?()\[\]\\|{}]')
+BATCH_SIZE = 1000
+
+
+def get_literal_prefix(path):
+    # Copy of painlessseo.index.get_literal_prefix at the time of writing
+    if not path or REGEX_CHARS_RE.search(PARAMETER_RE.sub('', path)):
+        return ''
+    literal = PARAMETER_RE.split(path, 1)[0]
+    return literal[:literal.rfind('/') + 1]
+
+
+def fill_literal_prefix(apps, schema_editor):
+    SeoMetadata = apps.get_model('painlessseo', 'SeoMetadata')
+    metadatas = SeoMetadata.objects.using(schema_editor.connection.alias)
+    changed = []
+    for seometadata in metadatas.filter(has_parameters=True).only(
+            'id', 'path').iterator(chunk_size=BATCH_SIZE):
+        seometadata.literal_prefix = get_literal_prefix(seometadata.path)
+        if seometadata.literal_prefix:
+            changed.append(seometadata)
+        if len(changed) == BATCH_SIZE:
+            metadatas.bulk_update(changed, ['literal_prefix'])
+            changed = []
+    metadatas.bulk_update(changed, ['literal_prefix'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('painlessseo', '0002_auto_20180723_0623'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seometadata',
+            name='literal_prefix',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200),
+        ),
+        # Covered by seo_path_lang_idx
+        migrations.AlterField(
+            model_name='seometadata',
+            name='path',
+            field=models.CharField(help_text="This should be an absolute path,                             excluding the domain name. Example: '/foo/bar/'.                             You can also capture parameters using '{X}'                             notation, where X is a positive number.", max_length=200, null=True, verbose_name='Path'),
+        ),
+        migrations.AddIndex(
+            model_name='seometadata',
+            index=models.Index(fields=['path', 'lang_code'], name='seo_path_lang_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seometadata',
+            index=models.Index(fields=['has_parameters', 'lang_code', 'priority'], name='seo_params_lang_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seometadata',
+            index=models.Index(fields=['has_parameters', 'lang_code', 'literal_prefix'], name='seo_params_lang_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seometadata',
+            index=models.Index(fields=['content_type', 'object_id', 'lang_code'], name='seo_object_lang_idx'),
+        ),
+        migrations.RunPython(fill_literal_prefix, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,195 @@
+# Copyright (C) 2014 Glamping Hub (https://glampinghub.com)
+# License: BSD 3-Clause
+from __future__ import unicode_literals
+
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from painlessseo import settings
+from painlessseo.cache import aget_versions, get_versions
+from painlessseo.models import SeoMetadata
+
+# Cached filters per language:
+# {lang_code: (built_at, metadata version, BloomFilter)}
+_filters = {}
+
+_misses_lock = threading.Lock()
+# Paths without any SeoMetadata, least recently used first:
+# {(path, lang_code): True}
+_misses = OrderedDict()
+_misses_state = {
+    'built_at': 0,
+    'version': None,
+}
+
+
+class BloomFilter(object):
+    """
+    Set of strings that can tell for sure that a string is not in it, and
+    is wrong about it being in it with probability error_rate.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def get_positions(self, string):
+        digest = hashlib.blake2b(string.encode('utf-8'),
+                                 digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + number * second) % self.size
+                for number in range(self.hashes)]
+
+    def add(self, string):
+        for position in self.get_positions(string):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, string):
+        for position in self.get_positions(string):
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+def is_fresh(built_at, built_version, version):
+    """
+    The filters and misses only depend on the SeoMetadata paths, so unlike
+    the index they don't follow SEO_INDEX_TIMEOUT, only the SeoMetadata
+    version and their own SEO_MISSES_TIMEOUT.
+    """
+    timeout = settings.SEO_MISSES_TIMEOUT
+    return built_version == version and (
+        timeout is None or time.time() - built_at < timeout)
+
+
+def build_exact_filter(paths, count):
+    exact_filter = BloomFilter(count, settings.SEO_EXACT_FILTER_ERROR_RATE)
+    for path in paths:
+        if path is not None:
+            exact_filter.add(path)
+    return exact_filter
+
+
+def get_exact_filter(lang_code, versions=None):
+    """
+    Returns the BloomFilter of every SeoMetadata path in lang_code, or None
+    when SEO_EXACT_FILTER is disabled. versions are the SeoVersions already
+    read for the current resolution, if any.
+    """
+    if not settings.SEO_EXACT_FILTER:
+        return None
+
+    cached = _filters.get(lang_code)
+    version = (versions or get_versions()).metadata
+    if cached is not None and is_fresh(cached[0], cached[1], version):
+        return cached[2]
+
+    metadatas = SeoMetadata.objects.filter(lang_code=lang_code)
+    exact_filter = build_exact_filter(
+        metadatas.values_list('path', flat=True).order_by().iterator(),
+        metadatas.count())
+    _filters[lang_code] = (time.time(), version, exact_filter)
+    return exact_filter
+
+
+async def aget_exact_filter(lang_code, versions=None):
+    """
+    Same as get_exact_filter, for async code.
+    """
+    if not settings.SEO_EXACT_FILTER:
+        return None
+
+    cached = _filters.get(lang_code)
+    version = (versions or await aget_versions()).metadata
+    if cached is not None and is_fresh(cached[0], cached[1], version):
+        return cached[2]
+
+    metadatas = SeoMetadata.objects.filter(lang_code=lang_code)
+    paths = [path async for path in
+             metadatas.values_list('path', flat=True).order_by()]
+    exact_filter = build_exact_filter(paths, len(paths))
+    _filters[lang_code] = (time.time(), version, exact_filter)
+    return exact_filter
+
+
+def get_possible_lang_codes(path, lang_codes, versions=None):
+    """
+    Returns the lang_codes that may have a SeoMetadata for exactly this
+    path, according to their filters.
+    """
+    if not settings.SEO_EXACT_FILTER:
+        return lang_codes
+    return [lang_code for lang_code in lang_codes
+            if path in get_exact_filter(lang_code, versions)]
+
+
+async def aget_possible_lang_codes(path, lang_codes, versions=None):
+    if not settings.SEO_EXACT_FILTER:
+        return lang_codes
+    return [lang_code for lang_code in lang_codes
+            if path in await aget_exact_filter(lang_code, versions)]
+
+
+def find_known_miss(path, lang_code, version):
+    key = (path, lang_code)
+    with _misses_lock:
+        if not is_fresh(_misses_state['built_at'], _misses_state['version'],
+                        version):
+            _misses.clear()
+            _misses_state['built_at'] = time.time()
+            _misses_state['version'] = version
+            return False
+        if key not in _misses:
+            return False
+        _misses.move_to_end(key)
+        return True
+
+
+def is_known_miss(path, lang_code, versions=None):
+    """
+    Returns whether the path was found to have no exact nor parameterized
+    SeoMetadata, in lang_code or the default language, since the last
+    change.
+    """
+    if not settings.SEO_NEGATIVE_CACHE_SIZE:
+        return False
+    return find_known_miss(path, lang_code,
+                           (versions or get_versions()).metadata)
+
+
+async def ais_known_miss(path, lang_code, versions=None):
+    if not settings.SEO_NEGATIVE_CACHE_SIZE:
+        return False
+    return find_known_miss(path, lang_code,
+                           (versions or await aget_versions()).metadata)
+
+
+def add_known_miss(path, lang_code):
+    if not settings.SEO_NEGATIVE_CACHE_SIZE:
+        return
+
+    with _misses_lock:
+        _misses[(path, lang_code)] = True
+        _misses.move_to_end((path, lang_code))
+        while len(_misses) > settings.SEO_NEGATIVE_CACHE_SIZE:
+            _misses.popitem(last=False)
+
+
+@receiver(post_save, sender=SeoMetadata,
+          dispatch_uid='painlessseo_clear_misses_save')
+@receiver(post_delete, sender=SeoMetadata,
+          dispatch_uid='painlessseo_clear_misses_delete')
+def clear_misses(**kwargs):
+    _filters.clear()
+    with _misses_lock:
+        _misses.clear()
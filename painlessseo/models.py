@@ -1,17 +1,38 @@
 # Copyright (C) 2014 Glamping Hub (https://glampinghub.com)
 # License: BSD 3-Clause
 from __future__ import unicode_literals
-from django.utils.encoding import python_2_unicode_compatible
+
+import re
 
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 
 from django.db import models
-from django.utils.translation import ugettext_lazy as _
+from django.utils.translation import gettext_lazy as _
 
 
 from painlessseo import settings
 
+# SeoMetadata fields needed to resolve the metadata of a path
+RESOLVER_FIELDS = ('id', 'path', 'lang_code', 'has_parameters', 'priority',
+                   'title', 'description', 'content_type', 'object_id')
+
+PARAMETER_RE = re.compile(r'\{\d+\}')
+# Any of these outside a {N} parameter makes the path behave as a regex
+REGEX_CHARS_RE = re.compile(r'[.^$*+?()\[\]\\|{}]')
+
+
+def get_literal_prefix(path):
+    """
+    Returns the start of the parameterized path up to the last '/' before
+    its first parameter, that every URL matching it starts with. Empty if
+    the path uses other regex characters, so it could match anything.
+    """
+    if not path or REGEX_CHARS_RE.search(PARAMETER_RE.sub('', path)):
+        return ''
+    literal = PARAMETER_RE.split(path, 1)[0]
+    return literal[:literal.rfind('/') + 1]
+
 
 class SeoRegisteredModel(models.Model):
     content_type = models.ForeignKey(ContentType, null=True, blank=True,
@@ -31,7 +52,6 @@ class SeoRegisteredModel(models.Model):
         verbose_name_plural = _('SEO Models')
 
 
-@python_2_unicode_compatible
 class SeoMetadata(models.Model):
     view_name = models.CharField(
         verbose_name=_('View Name'), max_length=30,
@@ -51,8 +71,8 @@ class SeoMetadata(models.Model):
         default=False,
         help_text=_("This indicates if the SEOMetadata path contains \
                     parameters."))
+    # Indexed together with lang_code in Meta.indexes
     path = models.CharField(verbose_name=_('Path'), max_length=200,
-                            db_index=True,
                             null=True, blank=False,
                             help_text=_("This should be an absolute path, \
                             excluding the domain name. Example: '/foo/bar/'. \
@@ -75,14 +95,41 @@ class SeoMetadata(models.Model):
                     Default 0"),
         blank=False, null=False, default=0)
 
+    # Start of the path that every matching URL has, up to the last '/'
+    # before the first parameter. Set on save when has_parameters is True.
+    literal_prefix = models.CharField(max_length=200, blank=True, default='',
+                                      editable=False)
+
     class Meta:
         verbose_name = _('SEO Path Metadata')
         verbose_name_plural = _('SEO Path Metadata')
         ordering = ('path', 'lang_code')
+        indexes = [
+            models.Index(fields=['path', 'lang_code'],
+                         name='seo_path_lang_idx'),
+            models.Index(fields=['has_parameters', 'lang_code', 'priority'],
+                         name='seo_params_lang_priority_idx'),
+            models.Index(fields=['has_parameters', 'lang_code',
+                                 'literal_prefix'],
+                         name='seo_params_lang_prefix_idx'),
+            models.Index(fields=['content_type', 'object_id', 'lang_code'],
+                         name='seo_object_lang_idx'),
+        ]
 
     def __str__(self):
         return "Language: %s | URL: %s" % (self.lang_code, self.path)
 
+    def save(self, *args, **kwargs):
+        self.literal_prefix = get_literal_prefix(self.path) \
+            if self.has_parameters else ''
+        # Saving only the path or has_parameters also updates the prefix
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and \
+                set(update_fields) & set(['path', 'has_parameters']):
+            kwargs['update_fields'] = set(update_fields) | set(
+                ['literal_prefix'])
+        super(SeoMetadata, self).save(*args, **kwargs)
+
     def get_metadata(self):
         result = {}
         for item in settings.SEO_FIELDS:
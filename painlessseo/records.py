@@ -0,0 +1,140 @@
+# Copyright (C) 2014 Glamping Hub (https://glampinghub.com)
+# License: BSD 3-Clause
+from __future__ import unicode_literals
+
+from painlessseo import settings
+
+# SeoMetadata columns a MetadataRecord is built from, in order
+METADATA_COLUMNS = ('id', 'path', 'lang_code', 'title', 'description',
+                    'priority', 'content_type_id', 'object_id',
+                    'has_parameters')
+# SeoRegisteredModel columns a RegisteredModelRecord is built from, in order
+REGISTERED_MODEL_COLUMNS = ('id', 'content_type_id', 'lang_code', 'title',
+                            'description')
+
+
+def intern_string(strings, string):
+    """
+    Returns the copy of string kept in the strings dict, so equal strings
+    loaded together share their memory.
+    """
+    return strings.setdefault(string, string)
+
+
+class MetadataRecord(object):
+    """
+    Read only copy of the SeoMetadata fields the resolver needs, kept in
+    memory instead of the model instance. Records are shared by every
+    request of the process, so they must never be changed.
+    """
+    __slots__ = METADATA_COLUMNS
+
+    def __init__(self, id, path, lang_code, title, description, priority,
+                 content_type_id, object_id, has_parameters):
+        self.id = id
+        self.path = path
+        self.lang_code = lang_code
+        self.title = title
+        self.description = description
+        self.priority = priority
+        self.content_type_id = content_type_id
+        self.object_id = object_id
+        self.has_parameters = bool(has_parameters)
+
+    @classmethod
+    def from_row(cls, row, strings=None):
+        """
+        Builds a record from a values_list(*METADATA_COLUMNS) row. When the
+        strings dict is given, the language and templates are interned in
+        it.
+        """
+        record = cls(*row)
+        if strings is not None:
+            record.intern(strings)
+        return record
+
+    def intern(self, strings):
+        """
+        Replaces the language and templates with their copies in the strings
+        dict. Only called before the record is shared.
+        """
+        self.lang_code = intern_string(strings, self.lang_code)
+        self.title = intern_string(strings, self.title)
+        self.description = intern_string(strings, self.description)
+        return self
+
+    def __repr__(self):
+        return "<MetadataRecord: Language: %s | URL: %s>" % (
+            self.lang_code, self.path)
+
+    def get_metadata(self):
+        result = {}
+        for item in settings.SEO_FIELDS:
+            result[item] = getattr(self, item)
+        return result
+
+
+class RegisteredModelRecord(object):
+    """
+    Read only copy of a SeoRegisteredModel, kept in memory instead of the
+    model instance.
+    """
+    __slots__ = REGISTERED_MODEL_COLUMNS
+
+    def __init__(self, id, content_type_id, lang_code, title, description):
+        self.id = id
+        self.content_type_id = content_type_id
+        self.lang_code = lang_code
+        self.title = title
+        self.description = description
+
+    @classmethod
+    def from_row(cls, row, strings=None):
+        """
+        Builds a record from a values_list(*REGISTERED_MODEL_COLUMNS) row,
+        interning its strings in the strings dict if given.
+        """
+        record = cls(*row)
+        if strings is not None:
+            record.intern(strings)
+        return record
+
+    def intern(self, strings):
+        """
+        Same as MetadataRecord.intern.
+        """
+        self.lang_code = intern_string(strings, self.lang_code)
+        self.title = intern_string(strings, self.title)
+        self.description = intern_string(strings, self.description)
+        return self
+
+    def __repr__(self):
+        return "<RegisteredModelRecord: Language: %s | Model: %s>" % (
+            self.lang_code, self.content_type_id)
+
+
+def get_metadata_records(queryset, strings=None):
+    """
+    Returns a MetadataRecord for every SeoMetadata of the queryset.
+    """
+    return [MetadataRecord.from_row(row, strings)
+            for row in queryset.values_list(*METADATA_COLUMNS)]
+
+
+async def aget_metadata_records(queryset, strings=None):
+    return [MetadataRecord.from_row(row, strings)
+            async for row in queryset.values_list(*METADATA_COLUMNS)]
+
+
+def get_registered_model_records(queryset, strings=None):
+    """
+    Returns a RegisteredModelRecord for every SeoRegisteredModel of the
+    queryset.
+    """
+    return [RegisteredModelRecord.from_row(row, strings)
+            for row in queryset.values_list(*REGISTERED_MODEL_COLUMNS)]
+
+
+async def aget_registered_model_records(queryset, strings=None):
+    return [RegisteredModelRecord.from_row(row, strings)
+            async for row in queryset.values_list(*REGISTERED_MODEL_COLUMNS)]
@@ -0,0 +1,286 @@
+# Copyright (C) 2014 Glamping Hub (https://glampinghub.com)
+# License: BSD 3-Clause
+from __future__ import unicode_literals
+
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+from painlessseo import settings
+from painlessseo.index import PatternIndex
+from painlessseo.misses import clear_misses
+from painlessseo.models import SeoMetadata, SeoRegisteredModel
+from painlessseo.records import MetadataRecord, RegisteredModelRecord
+
+# Routing file layout, all integers little endian:
+#
+# - HEADER.
+# - Records: one RECORD per SeoMetadata, ordered by id.
+# - Slots: open addressing hash table of exact paths. Every slot is the
+#   index + 1 of the first record for a (lang_code, path), or 0 if empty.
+# - Patterns: record index of every parameterized SeoMetadata.
+# - Pools: one POOL_RECORD per SeoRegisteredModel, ordered by id.
+# - Strings: UTF-8 strings referenced by (offset, length), each stored once.
+MAGIC = b'PSEOROUT'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sIIIIId5Q')
+# id, path, lang_code, title, description (offset and length of each),
+# priority, content_type_id, object_id and has_parameters
+RECORD = struct.Struct('<q8IiiqB')
+# id, content_type_id, lang_code, title and description
+POOL_RECORD = struct.Struct('<qi6I')
+INDEX = struct.Struct('<I')
+# Length of a None string
+NULL = 0xFFFFFFFF
+# Seconds between checks of whether the routing file was replaced
+CHECK_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_state = {
+    'table': None,
+    'checked_at': 0,
+}
+
+
+def get_key_hash(lang_code, path):
+    return zlib.crc32(('%s\n%s' % (lang_code, path)).encode('utf-8'))
+
+
+class StringPool(object):
+    def __init__(self):
+        self.offsets = {}
+        self.chunks = []
+        self.size = 0
+
+    def add(self, string):
+        if string is None:
+            return 0, NULL
+        data = string.encode('utf-8')
+        if data not in self.offsets:
+            self.offsets[data] = self.size
+            self.chunks.append(data)
+            self.size += len(data)
+        return self.offsets[data], len(data)
+
+
+def compile_routes(filename, chunk_size=2000):
+    """
+    Writes every SeoMetadata and SeoRegisteredModel to the routing file.
+    The file is written aside and then moved in place, so processes reading
+    the previous one are never affected. Returns (records, bytes written).
+    """
+    strings = StringPool()
+    records = []
+    exact = {}
+    patterns = []
+
+    fields = ('id', 'path', 'lang_code', 'title', 'description', 'priority',
+              'content_type_id', 'object_id', 'has_parameters')
+    rows = SeoMetadata.objects.order_by('id').values_list(*fields).iterator(
+        chunk_size=chunk_size)
+    for (pk, path, lang_code, title, description, priority, content_type_id,
+         object_id, has_parameters) in rows:
+        position = len(records)
+        records.append(RECORD.pack(
+            pk,
+            *(strings.add(path) + strings.add(lang_code) +
+              strings.add(title) + strings.add(description)),
+            priority,
+            -1 if content_type_id is None else content_type_id,
+            -1 if object_id is None else object_id,
+            has_parameters))
+        # Ordered by id, the first one wins like in get_exact_metadata
+        exact.setdefault((lang_code, path), position)
+        if has_parameters:
+            patterns.append(position)
+
+    slot_count = 1
+    while slot_count < len(exact) * 2:
+        slot_count *= 2
+    slots = [0] * slot_count
+    for (lang_code, path), position in exact.items():
+        slot = get_key_hash(lang_code, path) & (slot_count - 1)
+        while slots[slot]:
+            slot = (slot + 1) & (slot_count - 1)
+        slots[slot] = position + 1
+
+    pools = []
+    for seomodel in SeoRegisteredModel.objects.order_by('id'):
+        pools.append(POOL_RECORD.pack(
+            seomodel.id,
+            -1 if seomodel.content_type_id is None else
+            seomodel.content_type_id,
+            *(strings.add(seomodel.lang_code) + strings.add(seomodel.title) +
+              strings.add(seomodel.description))))
+
+    records_offset = HEADER.size
+    slots_offset = records_offset + len(records) * RECORD.size
+    patterns_offset = slots_offset + slot_count * INDEX.size
+    pools_offset = patterns_offset + len(patterns) * INDEX.size
+    strings_offset = pools_offset + len(pools) * POOL_RECORD.size
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    handle, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            output.write(HEADER.pack(
+                MAGIC, FORMAT_VERSION, len(records), slot_count,
+                len(patterns), len(pools), time.time(), records_offset,
+                slots_offset, patterns_offset, pools_offset, strings_offset))
+            output.write(b''.join(records))
+            output.write(struct.pack('<%dI' % slot_count, *slots))
+            output.write(struct.pack('<%dI' % len(patterns), *patterns))
+            output.write(b''.join(pools))
+            output.write(b''.join(strings.chunks))
+            output.flush()
+            os.fsync(output.fileno())
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, filename)
+    except BaseException:
+        os.remove(temporary)
+        raise
+    return len(records), strings_offset + strings.size
+
+
+class RoutingTable(object):
+    """
+    Read only view of a routing file mapped in memory. As the pages are
+    shared by every process mapping the same file, only the parameterized
+    paths and registered models are loaded into each process.
+
+    It has the same interface as ResolverSnapshot.
+    """
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as routing_file:
+            stat = os.fstat(routing_file.fileno())
+            self.buffer = mmap.mmap(routing_file.fileno(), 0,
+                                    access=mmap.ACCESS_READ)
+        self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        (magic, version, self.record_count, self.slot_count,
+         self.pattern_count, self.pool_count, self.compiled_at,
+         self.records_offset, self.slots_offset, self.patterns_offset,
+         self.pools_offset, self.strings_offset) = HEADER.unpack_from(
+            self.buffer)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError('%s is not a routing file of version %d.' % (
+                filename, FORMAT_VERSION))
+
+        self.patterns = {}
+        self.pools = {}
+        # Languages and templates of the records kept by this process
+        self.strings = {}
+        for position in range(self.pool_count):
+            (pk, content_type_id, lang_offset, lang_length, title_offset,
+             title_length, description_offset, description_length) = \
+                POOL_RECORD.unpack_from(
+                    self.buffer,
+                    self.pools_offset + position * POOL_RECORD.size)
+            seomodel = RegisteredModelRecord.from_row((
+                pk, content_type_id,
+                self.get_string(lang_offset, lang_length),
+                self.get_string(title_offset, title_length),
+                self.get_string(description_offset, description_length)),
+                self.strings)
+            self.pools.setdefault(
+                (content_type_id, seomodel.lang_code), []).append(seomodel)
+
+    def get_string(self, offset, length):
+        if length == NULL:
+            return None
+        start = self.strings_offset + offset
+        return self.buffer[start:start + length].decode('utf-8')
+
+    def get_record(self, position):
+        (pk, path_offset, path_length, lang_offset, lang_length, title_offset,
+         title_length, description_offset, description_length, priority,
+         content_type_id, object_id, has_parameters) = RECORD.unpack_from(
+            self.buffer, self.records_offset + position * RECORD.size)
+        return MetadataRecord.from_row((
+            pk,
+            self.get_string(path_offset, path_length),
+            self.get_string(lang_offset, lang_length),
+            self.get_string(title_offset, title_length),
+            self.get_string(description_offset, description_length),
+            priority,
+            None if content_type_id < 0 else content_type_id,
+            None if object_id < 0 else object_id,
+            has_parameters))
+
+    def get_exact(self, path, lang_code):
+        if not self.slot_count:
+            return []
+        mask = self.slot_count - 1
+        slot = get_key_hash(lang_code, path) & mask
+        while True:
+            position, = INDEX.unpack_from(
+                self.buffer, self.slots_offset + slot * INDEX.size)
+            if not position:
+                return []
+            seometadata = self.get_record(position - 1)
+            if seometadata.path == path and \
+                    seometadata.lang_code == lang_code:
+                return [seometadata]
+            slot = (slot + 1) & mask
+
+    def get_pattern_index(self, lang_code):
+        if lang_code not in self.patterns:
+            pattern_index = PatternIndex()
+            for number in range(self.pattern_count):
+                position, = INDEX.unpack_from(
+                    self.buffer, self.patterns_offset + number * INDEX.size)
+                seometadata = self.get_record(position)
+                if seometadata.lang_code == lang_code:
+                    pattern_index.add(seometadata.intern(self.strings))
+            self.patterns[lang_code] = pattern_index
+        return self.patterns[lang_code]
+
+    def get_pool(self, content_type_id, lang_code):
+        return self.pools.get((content_type_id, lang_code), [])
+
+
+def check_routing_file():
+    """
+    Makes the next get_routing_table call check the file again.
+    """
+    _state['checked_at'] = 0
+
+
+def get_routing_table():
+    """
+    Returns the RoutingTable of SEO_ROUTING_FILE, or None if it isn't set
+    or the file doesn't exist. It is opened again when the file has been
+    replaced, checking it at most once every CHECK_INTERVAL seconds.
+    """
+    filename = settings.SEO_ROUTING_FILE
+    if not filename:
+        return None
+
+    now = time.time()
+    if now - _state['checked_at'] < CHECK_INTERVAL:
+        return _state['table']
+
+    with _lock:
+        if now - _state['checked_at'] >= CHECK_INTERVAL:
+            table = _state['table']
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                table = None
+            else:
+                identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                if table is None or table.identity != identity:
+                    # The previous mapping stays valid for the threads still
+                    # using it, and is released with its last reference.
+                    table = RoutingTable(filename)
+            if table is not _state['table']:
+                # Built from the paths of the previous file, if any
+                clear_misses()
+            _state['table'] = table
+            _state['checked_at'] = now
+    return _state['table']
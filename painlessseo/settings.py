@@ -4,39 +4,136 @@ from __future__ import unicode_literals
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 
-DEFAULT_LANG_CODE = getattr(settings, 'LANGUAGE_CODE', 'en')[:2]
+# Every setting below is computed from the Django settings the first time it
+# is used, so importing this module doesn't require them to be configured.
 
-FALLBACK_TITLE = getattr(settings, 'DEFAULT_SEO_TITLES', None)
-if isinstance(FALLBACK_TITLE, str):
-    FALLBACK_TITLE = {
-        DEFAULT_LANG_CODE: FALLBACK_TITLE,
-    }
+SEO_FIELDS = ['title', 'description']
 
-FALLBACK_DESCRIPTION = getattr(settings, 'DEFAULT_SEO_DESCRIPTIONS', None)
-if isinstance(FALLBACK_DESCRIPTION, str):
-    FALLBACK_DESCRIPTION = {
-        DEFAULT_LANG_CODE: FALLBACK_DESCRIPTION,
-    }
 
-if FALLBACK_TITLE is None:
-    raise ImproperlyConfigured('DEFAULT_SEO_TITLES is not defined in \
-                                settings.')
+def get_default_lang_code():
+    return getattr(settings, 'LANGUAGE_CODE', 'en')[:2]
 
-if FALLBACK_DESCRIPTION is None:
-    raise ImproperlyConfigured('DEFAULT_SEO_DESCRIPTIONS is not defined in \
-                                settings.')
 
-I18N = getattr(settings, 'USE_I18N')
+def get_fallback(setting_name):
+    fallback = getattr(settings, setting_name, None)
+    if fallback is None:
+        raise ImproperlyConfigured('%s is not defined in settings.' %
+                                   setting_name)
 
-if I18N:
-    SEO_LANGUAGES = getattr(settings, 'LANGUAGES', None)
-    if not SEO_LANGUAGES:
-        raise ImproperlyConfigured('If USE_I18N is set to True, you need to \
-                                    define LANGUAGES in settings.')
-else:
-    SEO_LANGUAGES = ((DEFAULT_LANG_CODE, DEFAULT_LANG_CODE), )
+    if isinstance(fallback, str):
+        fallback = {
+            get_default_lang_code(): fallback,
+        }
+    if not isinstance(fallback, dict):
+        raise ImproperlyConfigured(
+            '%s must be a string or a dict of strings or lists of strings '
+            'by language code.' % setting_name)
+    if get_default_lang_code() not in fallback:
+        raise ImproperlyConfigured('%s has no value for the default language '
+                                   '%r.' % (setting_name,
+                                            get_default_lang_code()))
+    for lang_code, value in fallback.items():
+        values = value if isinstance(value, list) else [value]
+        if not values or not all(isinstance(item, str) for item in values):
+            raise ImproperlyConfigured(
+                '%s value for %r must be a string or a non empty list of '
+                'strings.' % (setting_name, lang_code))
+    return fallback
 
-SEO_MODELS = getattr(settings, 'SEO_MODELS', [])
 
-SEO_FIELDS = ['title', 'description']
+def get_seo_languages():
+    if getattr(settings, 'USE_I18N'):
+        languages = getattr(settings, 'LANGUAGES', None)
+        if not languages:
+            raise ImproperlyConfigured('If USE_I18N is set to True, you need \
+                                        to define LANGUAGES in settings.')
+        return languages
+
+    default_lang_code = get_default_lang_code()
+    return ((default_lang_code, default_lang_code), )
+
+
+LAZY_SETTINGS = {
+    'DEFAULT_LANG_CODE': get_default_lang_code,
+    'FALLBACK_TITLE': lambda: get_fallback('DEFAULT_SEO_TITLES'),
+    'FALLBACK_DESCRIPTION': lambda: get_fallback('DEFAULT_SEO_DESCRIPTIONS'),
+    'I18N': lambda: getattr(settings, 'USE_I18N'),
+    'SEO_LANGUAGES': get_seo_languages,
+    'SEO_MODELS': lambda: getattr(settings, 'SEO_MODELS', []),
+
+    # Seconds a process keeps its index of parameterized paths and registered
+    # models before reloading it. Saving or deleting any of them clears it in
+    # the current process. With 0 there is no index, and only the
+    # parameterized paths sharing a literal_prefix with the requested path
+    # are loaded.
+    'SEO_INDEX_TIMEOUT': lambda: getattr(settings, 'SEO_INDEX_TIMEOUT', 60),
+
+    # Keep an in memory copy of SeoMetadata and SeoRegisteredModel in every
+    # process, rebuilt after any of them is saved or deleted in that process.
+    'SEO_RESOLVER_SNAPSHOT': lambda: getattr(
+        settings, 'SEO_RESOLVER_SNAPSHOT', False),
+
+    # Cache alias where resolved titles and descriptions are shared by all
+    # processes, and how many seconds they are kept there.
+    'SEO_CACHE_ALIAS': lambda: getattr(settings, 'SEO_CACHE_ALIAS', None),
+    'SEO_CACHE_TIMEOUT': lambda: getattr(settings, 'SEO_CACHE_TIMEOUT', 3600),
+
+    # Sync the SeoMetadata of saved SEO_MODELS instances once, in bulk, when
+    # the transaction commits, instead of on every save.
+    'SEO_DEFER_UPDATES': lambda: getattr(settings, 'SEO_DEFER_UPDATES', False),
+
+    # Count the get_path_metadata calls answered by every tier, with their
+    # time and queries, and send the metadata_resolved signal for each of
+    # them.
+    'SEO_STATS': lambda: getattr(settings, 'SEO_STATS', False),
+
+    # Routing file written by compile_seo_routes. When it exists, paths are
+    # resolved from it, mapped in memory and shared by every process.
+    'SEO_ROUTING_FILE': lambda: getattr(settings, 'SEO_ROUTING_FILE', None),
+
+    # Keep a Bloom filter of the SeoMetadata paths of every language in each
+    # process, to skip the exact path query for most paths without one.
+    'SEO_EXACT_FILTER': lambda: getattr(settings, 'SEO_EXACT_FILTER', False),
+    'SEO_EXACT_FILTER_ERROR_RATE': lambda: getattr(
+        settings, 'SEO_EXACT_FILTER_ERROR_RATE', 0.01),
+
+    # Number of paths without any exact or parameterized SeoMetadata that
+    # each process remembers, to resolve them straight to the fallbacks.
+    'SEO_NEGATIVE_CACHE_SIZE': lambda: getattr(
+        settings, 'SEO_NEGATIVE_CACHE_SIZE', 0),
+
+    # Seconds a process keeps its exact path filters and known misses before
+    # rebuilding them, to notice the SeoMetadata saved by other processes
+    # without SEO_CACHE_ALIAS. Saving or deleting any of them clears them in
+    # the current process.
+    'SEO_MISSES_TIMEOUT': lambda: getattr(settings, 'SEO_MISSES_TIMEOUT', 300),
+}
+
+# Settings computed from others, reset together with them
+DEPENDENT_SETTINGS = {
+    'LANGUAGE_CODE': ['DEFAULT_LANG_CODE', 'FALLBACK_TITLE',
+                      'FALLBACK_DESCRIPTION', 'SEO_LANGUAGES'],
+    'DEFAULT_SEO_TITLES': ['FALLBACK_TITLE'],
+    'DEFAULT_SEO_DESCRIPTIONS': ['FALLBACK_DESCRIPTION'],
+    'USE_I18N': ['I18N', 'SEO_LANGUAGES'],
+    'LANGUAGES': ['SEO_LANGUAGES'],
+}
+
+
+def __getattr__(name):
+    if name not in LAZY_SETTINGS:
+        raise AttributeError("module %r has no attribute %r" % (
+            __name__, name))
+
+    # Stored in the module, so it is only computed once
+    value = globals()[name] = LAZY_SETTINGS[name]()
+    return value
+
+
+@receiver(setting_changed, dispatch_uid='painlessseo_reset_settings')
+def reset_settings(setting, **kwargs):
+    for name in DEPENDENT_SETTINGS.get(setting, [setting]):
+        globals().pop(name, None)
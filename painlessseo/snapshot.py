@@ -0,0 +1,157 @@
+# Copyright (C) 2014 Glamping Hub (https://glampinghub.com)
+# License: BSD 3-Clause
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from painlessseo import settings
+from painlessseo.cache import aget_versions, get_versions
+from painlessseo.index import PatternIndex
+from painlessseo.models import SeoMetadata, SeoRegisteredModel
+from painlessseo.records import (
+    METADATA_COLUMNS, MetadataRecord, get_registered_model_records)
+from painlessseo.routing import get_routing_table
+
+_build_lock = threading.Lock()
+_generation_lock = threading.Lock()
+_state = {
+    # Bumped on every write to SeoMetadata or SeoRegisteredModel
+    'generation': 0,
+    'snapshot': None,
+}
+
+
+class ResolverSnapshot(object):
+    """
+    In memory copy of the SeoMetadata and SeoRegisteredModel tables, so
+    that paths can be resolved without querying the database. Rows are kept
+    as records, with their languages and templates interned.
+    """
+
+    def __init__(self, generation, chunk_size=2000):
+        self.generation = generation
+        self.built_at = time.time()
+        # {lang_code: {path: first MetadataRecord by id}}
+        self.exact = {}
+        # {lang_code: PatternIndex}
+        self.patterns = {}
+        # {(content_type_id, lang_code): [RegisteredModelRecord, ...]}
+        self.pools = {}
+
+        strings = {}
+        rows = SeoMetadata.objects.order_by('id').values_list(
+            *METADATA_COLUMNS).iterator(chunk_size=chunk_size)
+        for row in rows:
+            seometadata = MetadataRecord.from_row(row, strings)
+            if seometadata.lang_code not in self.exact:
+                self.exact[seometadata.lang_code] = {}
+            self.exact[seometadata.lang_code].setdefault(
+                seometadata.path, seometadata)
+            if seometadata.has_parameters:
+                if seometadata.lang_code not in self.patterns:
+                    self.patterns[seometadata.lang_code] = PatternIndex()
+                self.patterns[seometadata.lang_code].add(seometadata)
+
+        for seomodel in get_registered_model_records(
+                SeoRegisteredModel.objects.order_by('id'), strings):
+            self.pools.setdefault(
+                (seomodel.content_type_id, seomodel.lang_code), []).append(
+                seomodel)
+
+    def get_exact(self, path, lang_code):
+        seometadata = self.exact.get(lang_code, {}).get(path)
+        return [] if seometadata is None else [seometadata]
+
+    def get_pattern_index(self, lang_code):
+        return self.patterns.get(lang_code) or PatternIndex()
+
+    def get_pool(self, content_type_id, lang_code):
+        return self.pools.get((content_type_id, lang_code), [])
+
+
+def get_generation(versions):
+    """
+    Returns the local generation, together with the SeoMetadata and
+    SeoRegisteredModel versions shared through SEO_CACHE_ALIAS so writes
+    done by other processes are noticed.
+    """
+    return (_state['generation'], versions.metadata, versions.models)
+
+
+def is_current(snapshot, generation):
+    """
+    Without SEO_CACHE_ALIAS the writes done by other processes can't be
+    noticed, so like the per process indexes the snapshot is also rebuilt
+    after SEO_INDEX_TIMEOUT seconds. With SEO_INDEX_TIMEOUT = 0 there is no
+    index to follow, and it never expires.
+    """
+    if snapshot is None or snapshot.generation != generation:
+        return False
+    timeout = settings.SEO_INDEX_TIMEOUT
+    return not timeout or time.time() - snapshot.built_at < timeout
+
+
+def get_snapshot(versions=None):
+    """
+    Returns the current ResolverSnapshot, or None when SEO_RESOLVER_SNAPSHOT
+    is disabled. It is rebuilt on first use after the generation changes,
+    or once it is older than SEO_INDEX_TIMEOUT.
+    versions are the SeoVersions already read for the current resolution,
+    if any.
+
+    When SEO_ROUTING_FILE exists, its RoutingTable is returned instead.
+    """
+    table = get_routing_table()
+    if table is not None:
+        return table
+
+    if not settings.SEO_RESOLVER_SNAPSHOT:
+        return None
+
+    snapshot = _state['snapshot']
+    generation = get_generation(versions or get_versions())
+    if not is_current(snapshot, generation):
+        with _build_lock:
+            snapshot = _state['snapshot']
+            generation = get_generation(versions or get_versions())
+            if not is_current(snapshot, generation):
+                snapshot = ResolverSnapshot(generation)
+                _state['snapshot'] = snapshot
+    return snapshot
+
+
+async def aget_snapshot(versions=None):
+    """
+    Same as get_snapshot, for async code. Only leaves the event loop when
+    the snapshot has to be rebuilt.
+    """
+    table = get_routing_table()
+    if table is not None:
+        return table
+
+    if not settings.SEO_RESOLVER_SNAPSHOT:
+        return None
+
+    versions = versions or await aget_versions()
+    snapshot = _state['snapshot']
+    if not is_current(snapshot, get_generation(versions)):
+        snapshot = await sync_to_async(get_snapshot)(versions)
+    return snapshot
+
+
+@receiver(post_save, sender=SeoMetadata,
+          dispatch_uid='painlessseo_bump_generation_metadata_save')
+@receiver(post_delete, sender=SeoMetadata,
+          dispatch_uid='painlessseo_bump_generation_metadata_delete')
+@receiver(post_save, sender=SeoRegisteredModel,
+          dispatch_uid='painlessseo_bump_generation_model_save')
+@receiver(post_delete, sender=SeoRegisteredModel,
+          dispatch_uid='painlessseo_bump_generation_model_delete')
+def bump_generation(**kwargs):
+    with _generation_lock:
+        _state['generation'] += 1
@@ -0,0 +1,107 @@
+# Copyright (C) 2014 Glamping Hub (https://glampinghub.com)
+# License: BSD 3-Clause
+from __future__ import unicode_literals
+
+import threading
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+from django.dispatch import Signal
+
+from painlessseo.models import SeoMetadata
+
+# Where the metadata of a path came from
+TIER_CACHE = 'cache'
+TIER_EXACT = 'exact'
+TIER_LANGUAGE = 'language'
+TIER_REGISTERED_MODEL = 'registered_model'
+TIER_PARAMETERIZED = 'parameterized'
+TIER_FALLBACK = 'fallback'
+TIERS = (TIER_CACHE, TIER_EXACT, TIER_LANGUAGE, TIER_REGISTERED_MODEL,
+         TIER_PARAMETERIZED, TIER_FALLBACK)
+
+# Sent with SEO_STATS enabled after every get_path_metadata call, with the
+# path, lang_code, tier, elapsed seconds and queries done. queries is None
+# for aget_path_metadata, whose queries run in other threads.
+metadata_resolved = Signal()
+
+_lock = threading.Lock()
+# {tier: [calls, seconds, max seconds, queries, calls with queries]}
+_counters = {}
+
+
+class QueryCounter(object):
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def record(path, lang_code, tier, elapsed, queries=None):
+    """
+    Adds a resolution to the counters of this process and sends
+    metadata_resolved.
+    """
+    with _lock:
+        counters = _counters.setdefault(tier, [0, 0.0, 0.0, 0, 0])
+        counters[0] += 1
+        counters[1] += elapsed
+        counters[2] = max(counters[2], elapsed)
+        if queries is not None:
+            counters[3] += queries
+            counters[4] += 1
+
+    metadata_resolved.send(sender=SeoMetadata, path=path, lang_code=lang_code,
+                           tier=tier, elapsed=elapsed, queries=queries)
+
+
+def measure(resolve, path, lang_code, instance=None, seo_context={}):
+    """
+    Calls resolve, that returns the (formatted metadata, tier) of the path,
+    recording its tier, time and queries. Returns the formatted metadata.
+    """
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        start = time.perf_counter()
+        formatted_result, tier = resolve(path, lang_code, instance,
+                                         seo_context)
+        elapsed = time.perf_counter() - start
+
+    record(path, lang_code, tier, elapsed, counter.count)
+    return formatted_result
+
+
+def get_stats():
+    """
+    Returns the counters of this process, as a list of dicts sorted by tier.
+    """
+    with _lock:
+        counters = dict((tier, list(values))
+                        for tier, values in _counters.items())
+
+    stats = []
+    for tier in TIERS:
+        if tier not in counters:
+            continue
+        calls, seconds, max_seconds, queries, counted = counters[tier]
+        stats.append({
+            'tier': tier,
+            'calls': calls,
+            'seconds': seconds,
+            'mean_ms': seconds / calls * 1000,
+            'max_ms': max_seconds * 1000,
+            'queries': queries,
+            'queries_per_call': (float(queries) / counted
+                                 if counted else None),
+        })
+    return stats
+
+
+def reset_stats():
+    with _lock:
+        _counters.clear()
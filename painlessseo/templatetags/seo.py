@@ -2,14 +2,25 @@
 # License: BSD 3-Clause
 from __future__ import unicode_literals
 
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+
 from django.template import Library
+from django.utils.html import conditional_escape
+from django.utils.safestring import mark_safe
+from django.utils.text import Truncator
 from django.utils.translation import get_language
 
-from painlessseo.utils import get_path_metadata
+from painlessseo.utils import aget_path_metadata, get_path_metadata
 from django import template
 
 register = Library()
 
+# Output of 'painlessseo/metadata.html' for a given title and description
+METADATA_HTML = '\n\n\n\n\n<title>%s</title>\n\n' \
+    '<meta name="description" content="%s">\n\n'
+
 
 @register.filter
 def single_quotes(description):
@@ -42,29 +53,83 @@ class CaptureAsNode(template.Node):
         return ''
 
 
-@register.inclusion_tag('painlessseo/metadata.html', takes_context=True)
-def get_seo(context, **kwargs):
-    path = context['request'].path
-    lang_code = get_language()[:2]
-    view = context.get('view', None)
+def get_view_seo(view):
+    """
+    Returns the (instance, seo context) given by the view, if any.
+    """
     seo_context = {}
     seo_obj = None
 
     if view:
-        # Try to get the instance if exists
-        try:
-            if hasattr(view, 'get_object'):
-                seo_obj = view.get_object()
-        except AttributeError:
-            pass
+        # Reuse the instance already loaded by the view, if any
+        seo_obj = getattr(view, 'object', None)
+        if seo_obj is None:
+            # Try to get the instance if exists
+            try:
+                if hasattr(view, 'get_object'):
+                    seo_obj = view.get_object()
+            except AttributeError:
+                pass
 
         if hasattr(view, 'get_seo_context'):
             seo_context = view.get_seo_context()
 
-    metadata = get_path_metadata(
-        path=path, lang_code=lang_code,
-        instance=seo_obj,
-        seo_context=seo_context)
+    return seo_obj, seo_context
+
+
+def get_resolved_metadata(request):
+    resolved = getattr(request, '_seo_metadata', None)
+    if resolved is None:
+        resolved = request._seo_metadata = {}
+    return resolved
+
+
+def get_request_metadata(context):
+    """
+    Resolves the metadata of the current request only once, no matter how
+    many SEO tags are used in the page.
+    """
+    request = context['request']
+    path = request.path
+    lang_code = get_language()[:2]
+
+    resolved = get_resolved_metadata(request)
+    if (path, lang_code) not in resolved:
+        seo_obj, seo_context = get_view_seo(context.get('view', None))
+        resolved[(path, lang_code)] = get_path_metadata(
+            path=path, lang_code=lang_code,
+            instance=seo_obj,
+            seo_context=seo_context)
+
+    return resolved[(path, lang_code)]
+
+
+async def aget_request_metadata(request, view=None):
+    """
+    Resolves the metadata of the request from an async view, before the
+    response is rendered. The SEO tags of the page then reuse it instead of
+    querying the database from the sync template engine.
+    """
+    path = request.path
+    lang_code = get_language()[:2]
+
+    resolved = get_resolved_metadata(request)
+    if (path, lang_code) not in resolved:
+        seo_obj, seo_context = None, {}
+        if view is not None:
+            # get_object() and get_seo_context() may use the sync ORM
+            seo_obj, seo_context = await sync_to_async(get_view_seo)(view)
+        resolved[(path, lang_code)] = await aget_path_metadata(
+            path=path, lang_code=lang_code,
+            instance=seo_obj,
+            seo_context=seo_context)
+
+    return resolved[(path, lang_code)]
+
+
+@register.inclusion_tag('painlessseo/metadata.html', takes_context=True)
+def get_seo(context, **kwargs):
+    metadata = get_request_metadata(context)
 
     result = {}
     for item in ['title', 'description']:
@@ -74,6 +139,31 @@ def get_seo(context, **kwargs):
     return result
 
 
+@lru_cache(maxsize=1024)
+def render_metadata(title, description):
+    """
+    Renders the same HTML as 'painlessseo/metadata.html' without going
+    through the template engine. Results are cached by title and
+    description.
+    """
+    seo_title = " ".join(str(title or '').split())
+    seo_description = " ".join(
+        str(conditional_escape(description or '')).split())
+    return METADATA_HTML % (
+        conditional_escape(Truncator(seo_title).chars(65)),
+        Truncator(single_quotes(seo_description)).chars(155))
+
+
+@register.simple_tag(takes_context=True)
+def get_seo_html(context, **kwargs):
+    """
+    Faster alternative to get_seo, that doesn't allow overriding the
+    'painlessseo/metadata.html' template.
+    """
+    result = get_seo(context, **kwargs)
+    return mark_safe(render_metadata(result['title'], result['description']))
+
+
 @register.simple_tag(takes_context=True)
 def get_seo_title(context, default=''):
     return get_seo(context, title=default).get('title')
@@ -1,2 +1,1428 @@
 # -*- coding: utf-8 -*-
-from django.utils import unittest
+# Copyright (C) 2014 Glamping Hub (https://glampinghub.com)
+# License: BSD 3-Clause
+from __future__ import unicode_literals
+
+from io import StringIO
+import importlib
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps
+from django.contrib.admin import AdminSite
+from django.contrib.auth.models import Permission, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import signals
+from django.template import Context, Template
+from django.template.loader import render_to_string
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path as url_path
+from django.utils import translation
+from django.views import generic
+
+from painlessseo import settings, stats
+from painlessseo.admin import SeoMetadataAdmin
+from painlessseo.cache import (
+    SeoVersions, bump_instance_versions, bump_metadata_version,
+    get_metadata_key, get_versions)
+from painlessseo.formatting import (
+    get_template_plan, prefetch_instance, render_template)
+from painlessseo.index import (
+    PatternIndex, get_pattern_index, get_registered_pool)
+from painlessseo.misses import (
+    BloomFilter, add_known_miss, get_exact_filter, get_possible_lang_codes,
+    is_known_miss)
+from painlessseo.models import (
+    SeoMetadata, SeoRegisteredModel, get_literal_prefix)
+from painlessseo.records import (
+    METADATA_COLUMNS, MetadataRecord, RegisteredModelRecord,
+    get_metadata_records)
+from painlessseo.routing import (
+    RoutingTable, check_routing_file, compile_routes, get_routing_table)
+from painlessseo.snapshot import get_snapshot
+from painlessseo.templatetags import seo
+from painlessseo.utils import (
+    aget_path_metadata, bulk_update_seo, clear_seo_caches, defer_update_seo,
+    delete_orphaned_seo, format_metadata, get_abstract_matches,
+    get_exact_metadata, get_instance_metadata, get_path_metadata,
+    get_path_metadata_many, iter_resolved_metadata, register_seo_signals)
+
+SEO_SETTINGS = {
+    'USE_I18N': True,
+    'LANGUAGE_CODE': 'en',
+    'LANGUAGES': [('en', 'English'), ('es', 'Spanish')],
+    'DEFAULT_SEO_TITLES': {'en': 'Default title', 'es': 'Titulo'},
+    'DEFAULT_SEO_DESCRIPTIONS': {'en': 'Default description',
+                                 'es': 'Descripcion'},
+    'CACHES': {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'seo': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'painlessseo-tests',
+        },
+    },
+    'SEO_CACHE_ALIAS': None,
+    'SEO_INDEX_TIMEOUT': 60,
+    'SEO_RESOLVER_SNAPSHOT': False,
+    'SEO_DEFER_UPDATES': False,
+    'SEO_STATS': False,
+    'SEO_ROUTING_FILE': None,
+    'SEO_EXACT_FILTER': False,
+    'SEO_NEGATIVE_CACHE_SIZE': 0,
+    'SEO_MISSES_TIMEOUT': 300,
+}
+
+# Parameterized paths of every kind the PatternIndex handles
+PATTERNS = [
+    ('/blog/{0}/', 0),
+    ('/blog/{0}/{1}/', 0),
+    ('/blog/page-{0}/', 2),
+    ('/blog/{0}/comments/', 1),
+    ('/b.og/{0}/', 0),
+    ('/shop/{0}/', 5),
+    ('/{0}/about/', 0),
+]
+PATHS = [
+    '/blog/first/', '/blog/first/second/', '/blog/page-3/',
+    '/blog/first/comments/', '/bxog/first/', '/shop/boots/', '/en/about/',
+    '/blog/', '/blog//', '/shop/boots/red/', '/nothing/', '/',
+]
+
+
+class VisitorView(generic.DetailView):
+    model = ContentType
+
+    def get_seo_context(self):
+        return {'1': 'guest' if self.request.user.is_anonymous else 'user'}
+
+
+class BrokenView(generic.View):
+    def get_object(self):
+        raise ValueError('Broken view')
+
+
+urlpatterns = [
+    url_path('types/<int:pk>/',
+             generic.DetailView.as_view(model=ContentType)),
+    url_path('visitors/<int:pk>/', VisitorView.as_view()),
+    url_path('broken/', BrokenView.as_view()),
+]
+
+
+def get_record_fields(seometadata):
+    return tuple(getattr(seometadata, column) for column in METADATA_COLUMNS)
+
+
+@override_settings(**SEO_SETTINGS)
+class SeoTestCase(TestCase):
+    def setUp(self):
+        # The per process caches aren't rolled back with the database
+        clear_seo_caches()
+        self.addCleanup(clear_seo_caches)
+
+    def create_metadata(self, path, lang_code='en', priority=0, **kwargs):
+        return SeoMetadata.objects.create(
+            path=path, lang_code=lang_code, priority=priority,
+            has_parameters='{' in path, title=kwargs.pop('title', path),
+            description=kwargs.pop('description', 'About %s' % path),
+            **kwargs)
+
+
+class PatternIndexTest(SeoTestCase):
+    def setUp(self):
+        super(PatternIndexTest, self).setUp()
+        for path, priority in PATTERNS:
+            self.create_metadata(path, priority=priority)
+        self.metadatas = list(SeoMetadata.objects.filter(
+            has_parameters=True).order_by('id'))
+        self.index = PatternIndex(get_metadata_records(
+            SeoMetadata.objects.filter(has_parameters=True)))
+
+    def test_matches_like_regex_scan(self):
+        for path in PATHS:
+            found = set((match['seometadata'].id, match['groups'])
+                        for match in self.index.match(path))
+            expected = set((match['seometadata'].id, match['groups'])
+                           for match in get_abstract_matches(
+                               path, self.metadatas))
+            self.assertEqual(found, expected, path)
+
+    def test_higher_priorities_first(self):
+        matches = self.index.match('/blog/page-3/')
+        self.assertEqual(
+            [match['seometadata'].path for match in matches],
+            ['/blog/page-{0}/', '/blog/{0}/', '/b.og/{0}/'])
+        self.assertEqual(matches[0]['groups'], ('3', ))
+
+        matches = self.index.match('/blog/page-3/', min_priority=1)
+        self.assertEqual([match['seometadata'].path for match in matches],
+                         ['/blog/page-{0}/'])
+
+    def test_resolves_parameters(self):
+        SeoMetadata.objects.filter(path='/shop/{0}/').update(
+            title='Buy {0}')
+        clear_seo_caches()
+        self.assertEqual(get_path_metadata('/shop/boots/', 'en')['title'],
+                         'Buy Boots')
+        self.assertEqual(get_path_metadata('/shop/boots/', 'es')['title'],
+                         'Buy Boots')
+
+    def test_rebuilt_after_changes(self):
+        pattern_index = get_pattern_index('en')
+        self.assertIs(get_pattern_index('en'), pattern_index)
+
+        self.create_metadata('/new/{0}/')
+        self.assertIsNot(get_pattern_index('en'), pattern_index)
+        self.assertEqual(
+            [match['groups'] for match in get_pattern_index('en').match(
+                '/new/first/')], [('first', )])
+        self.assertEqual(get_pattern_index('es').match('/new/first/'), [])
+
+
+class ExactPathTest(SeoTestCase):
+    def test_single_query(self):
+        self.create_metadata('/exact/', title='Exact')
+        self.create_metadata('/exact/', lang_code='es', title='Exacto')
+        self.create_metadata('/only-en/', title='Only english')
+        with self.assertNumQueries(1):
+            self.assertEqual(get_exact_metadata('/exact/', 'es').title,
+                             'Exacto')
+        with self.assertNumQueries(1):
+            self.assertEqual(get_exact_metadata('/only-en/', 'es').title,
+                             'Only english')
+        with self.assertNumQueries(1):
+            self.assertIsNone(get_exact_metadata('/nothing/', 'es'))
+
+
+class RegisteredModelTest(SeoTestCase):
+    def setUp(self):
+        super(RegisteredModelTest, self).setUp()
+        self.content_type = ContentType.objects.get_for_model(SeoMetadata)
+        for title in ['First {title}', 'Second {title}']:
+            SeoRegisteredModel.objects.create(
+                content_type=self.content_type, lang_code='en', title=title,
+                description='About {path}')
+        self.first = self.create_metadata('/first/', title='One')
+        self.second = self.create_metadata('/second/', title='Two')
+
+    def test_same_choice_per_instance(self):
+        for instance in [self.first, self.second]:
+            expected = ['First {title}', 'Second {title}'][instance.pk % 2]
+            for attempt in range(3):
+                self.assertEqual(
+                    get_instance_metadata(instance, 'en')['title'], expected)
+
+        self.assertEqual(
+            get_path_metadata('/page/', 'en', instance=self.first),
+            {'title': '%s One' % ['First', 'Second'][self.first.pk % 2],
+             'description': 'About /first/'})
+
+    def test_pool_cached(self):
+        pool = get_registered_pool(self.content_type.id, 'en')
+        self.assertEqual([seomodel.title for seomodel in pool],
+                         ['First {title}', 'Second {title}'])
+        with self.assertNumQueries(0):
+            self.assertIs(get_registered_pool(self.content_type.id, 'en'),
+                          pool)
+        self.assertEqual(get_registered_pool(self.content_type.id, 'es'), [])
+
+        SeoRegisteredModel.objects.filter(title='First {title}').delete()
+        self.assertEqual(
+            [seomodel.title for seomodel in get_registered_pool(
+                self.content_type.id, 'en')], ['Second {title}'])
+
+
+class LiteralPrefixTest(SeoTestCase):
+    def setUp(self):
+        super(LiteralPrefixTest, self).setUp()
+        self.create_metadata('/exact/')
+        for path, priority in PATTERNS:
+            self.create_metadata(path, priority=priority)
+            self.create_metadata(path, lang_code='es', priority=priority)
+
+    def get_prefixes(self):
+        return dict(SeoMetadata.objects.filter(lang_code='en').values_list(
+            'path', 'literal_prefix'))
+
+    def test_get_literal_prefix(self):
+        cases = [
+            ('/blog/{0}/', '/blog/'),
+            ('/blog/page-{0}/', '/blog/'),
+            ('/blog/{0}/{1}/', '/blog/'),
+            ('/{0}/about/', '/'),
+            ('/b.og/{0}/', ''),
+            (None, ''),
+        ]
+        for path, prefix in cases:
+            self.assertEqual(get_literal_prefix(path), prefix, path)
+
+    def test_set_on_save(self):
+        expected = dict((path, get_literal_prefix(path))
+                        for path, priority in PATTERNS)
+        expected['/exact/'] = ''
+        self.assertEqual(self.get_prefixes(), expected)
+
+    def test_set_on_update_fields(self):
+        seometadata = SeoMetadata.objects.get(path='/blog/{0}/',
+                                              lang_code='en')
+        seometadata.path = '/news/{0}/'
+        seometadata.save(update_fields=['path'])
+        self.assertEqual(self.get_prefixes()['/news/{0}/'], '/news/')
+
+    def test_migration(self):
+        migration = importlib.import_module(
+            'painlessseo.migrations.0003_seometadata_literal_prefix')
+        expected = self.get_prefixes()
+        SeoMetadata.objects.update(literal_prefix='')
+        migration.fill_literal_prefix(
+            apps, SimpleNamespace(connection=connection))
+        self.assertEqual(self.get_prefixes(), expected)
+
+    def test_indexes(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, SeoMetadata._meta.db_table)
+        indexes = [constraint['columns']
+                   for constraint in constraints.values()
+                   if constraint['index'] and not constraint['primary_key']]
+        self.assertIn(['path', 'lang_code'], indexes)
+        # Covered by the one above
+        self.assertNotIn(['path'], indexes)
+
+    def test_without_index(self):
+        expected = [get_path_metadata(path, lang_code)
+                    for path in PATHS for lang_code in ['en', 'es']]
+        with override_settings(SEO_INDEX_TIMEOUT=0):
+            # The exact path, and only the patterns that could match it
+            with self.assertNumQueries(2):
+                get_path_metadata('/blog/page-3/', 'en')
+            self.assertEqual([get_path_metadata(path, lang_code)
+                              for path in PATHS
+                              for lang_code in ['en', 'es']], expected)
+
+
+class SnapshotTest(SeoTestCase):
+    def setUp(self):
+        super(SnapshotTest, self).setUp()
+        self.create_metadata('/exact/', title='Exact')
+
+    @override_settings(SEO_RESOLVER_SNAPSHOT=True)
+    def test_rebuilt_after_changes(self):
+        snapshot = get_snapshot()
+        self.assertIs(get_snapshot(), snapshot)
+        self.assertEqual(get_path_metadata('/exact/', 'en')['title'], 'Exact')
+
+        self.create_metadata('/other/', title='Other')
+        self.assertIsNot(get_snapshot(), snapshot)
+        self.assertEqual(get_path_metadata('/other/', 'en')['title'], 'Other')
+
+    @override_settings(SEO_RESOLVER_SNAPSHOT=True)
+    def test_expires_without_shared_cache(self):
+        snapshot = get_snapshot()
+        # Like a change done by another process, without signals
+        SeoMetadata.objects.filter(path='/exact/').update(title='Changed')
+        self.assertIs(get_snapshot(), snapshot)
+        self.assertEqual(get_path_metadata('/exact/', 'en')['title'], 'Exact')
+
+        snapshot.built_at -= settings.SEO_INDEX_TIMEOUT + 1
+        self.assertIsNot(get_snapshot(), snapshot)
+        self.assertEqual(get_path_metadata('/exact/', 'en')['title'],
+                         'Changed')
+
+    @override_settings(SEO_RESOLVER_SNAPSHOT=True)
+    def test_resolves_without_queries(self):
+        for path, priority in PATTERNS:
+            self.create_metadata(path, priority=priority)
+        snapshot = get_snapshot()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_path_metadata('/exact/', 'es')['title'],
+                             'Exact')
+            self.assertEqual(get_path_metadata('/nothing/', 'en')['title'],
+                             'Default title')
+
+        for path in PATHS:
+            self.assertEqual(
+                [(match['seometadata'].id, match['groups'])
+                 for match in snapshot.get_pattern_index('en').match(path)],
+                [(match['seometadata'].id, match['groups'])
+                 for match in get_pattern_index('en').match(path)])
+
+    def test_disabled(self):
+        self.assertIsNone(get_snapshot())
+
+    @override_settings(SEO_RESOLVER_SNAPSHOT=True, SEO_CACHE_ALIAS='seo')
+    def test_follows_shared_versions(self):
+        snapshot = get_snapshot()
+        # Saving instances only invalidates their cached results
+        bump_instance_versions([ContentType.objects.get_for_model(
+            SeoMetadata)])
+        self.assertIs(get_snapshot(), snapshot)
+
+        # Like a SeoMetadata saved by another process
+        bump_metadata_version()
+        self.assertIsNot(get_snapshot(), snapshot)
+
+    @override_settings(SEO_RESOLVER_SNAPSHOT=True)
+    def test_keeps_records(self):
+        seometadata = get_snapshot().get_exact('/exact/', 'en')[0]
+        self.assertIsInstance(seometadata, MetadataRecord)
+        self.assertEqual(get_record_fields(seometadata), get_record_fields(
+            SeoMetadata.objects.get(path='/exact/')))
+
+
+@override_settings(SEO_CACHE_ALIAS='seo')
+class SharedCacheTest(SeoTestCase):
+    def setUp(self):
+        super(SharedCacheTest, self).setUp()
+        caches['seo'].clear()
+        self.create_metadata('/exact/', title='Exact')
+
+    def test_reused_until_changed(self):
+        self.assertEqual(get_path_metadata('/exact/', 'en')['title'], 'Exact')
+        # Like a change done without signals
+        SeoMetadata.objects.filter(path='/exact/').update(title='Changed')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_path_metadata('/exact/', 'en')['title'],
+                             'Exact')
+
+        SeoMetadata.objects.get(path='/exact/').save()
+        self.assertEqual(get_path_metadata('/exact/', 'en')['title'],
+                         'Changed')
+
+    def test_pattern_index_follows_shared_version(self):
+        pattern_index = get_pattern_index('en')
+        self.assertIs(get_pattern_index('en'), pattern_index)
+
+        bump_metadata_version()
+        self.assertIsNot(get_pattern_index('en'), pattern_index)
+
+    def test_instance_versions(self):
+        content_type = ContentType.objects.get_for_model(SeoMetadata)
+        other = ContentType.objects.get_for_model(SeoRegisteredModel)
+        get_path_metadata('/exact/', 'en', content_type)
+        get_path_metadata('/exact/', 'en', other)
+
+        # Like a save of the instance
+        bump_instance_versions([content_type])
+        with self.assertNumQueries(0):
+            get_path_metadata('/exact/', 'en', other)
+        with CaptureQueriesContext(connection) as queries:
+            get_path_metadata('/exact/', 'en', content_type)
+        self.assertTrue(queries.captured_queries)
+
+    def test_content_object_versions(self):
+        content_object = ContentType.objects.get_for_model(SeoRegisteredModel)
+        self.create_metadata(
+            '/linked/', title='{model} linked',
+            content_type=ContentType.objects.get_for_model(ContentType),
+            object_id=content_object.pk)
+        self.addCleanup(ContentType.objects.clear_cache)
+        resolvers = [
+            lambda: get_path_metadata('/linked/', 'en'),
+            lambda: get_path_metadata_many([('/linked/', 'en', None)])[0],
+            lambda: async_to_sync(aget_path_metadata)('/linked/', 'en'),
+        ]
+        for resolve in resolvers:
+            caches['seo'].clear()
+            ContentType.objects.filter(pk=content_object.pk).update(
+                model='before')
+            self.assertEqual(resolve()['title'], 'before linked')
+            # Like a change done without signals
+            ContentType.objects.filter(pk=content_object.pk).update(
+                model='after')
+            self.assertEqual(resolve()['title'], 'before linked')
+
+            # Like a save of the content object
+            bump_instance_versions([content_object])
+            self.assertEqual(resolve()['title'], 'after linked')
+
+    def test_keys(self):
+        versions = SeoVersions(1, 1, None)
+        keys = set([
+            get_metadata_key('/exact/', 'en', versions=versions),
+            get_metadata_key('/exact/', 'es', versions=versions),
+            get_metadata_key('/other/', 'en', versions=versions),
+            get_metadata_key('/exact/', 'en',
+                             versions=SeoVersions(2, 1, None)),
+            get_metadata_key('/exact/', 'en',
+                             versions=SeoVersions(1, 2, None)),
+            get_metadata_key('/exact/', 'en', versions=versions,
+                             instance_version='a'),
+            get_metadata_key('/exact/', 'en', seo_context={'0': 'page'},
+                             versions=versions),
+        ])
+        self.assertEqual(len(keys), 7)
+        self.assertEqual(get_metadata_key('/exact/', 'en', versions=versions),
+                         get_metadata_key('/exact/', 'en', seo_context={},
+                                          versions=versions))
+
+
+class FormattingTest(SeoTestCase):
+    def setUp(self):
+        super(FormattingTest, self).setUp()
+        self.content_type = ContentType.objects.get_for_model(SeoMetadata)
+        self.seometadata = self.create_metadata(
+            '/exact/', title='Exact', content_type=self.content_type,
+            object_id=1)
+        self.orphan = self.create_metadata('/orphan/', title='Orphan')
+
+    def test_params(self):
+        self.assertEqual(
+            render_template('Page {0} of { 1 }',
+                            params={'0': 'first-page', '1': 'blog'}),
+            'Page First Page of Blog')
+        self.assertEqual(render_template('{0} {nothing}', params={'0': 'a'}),
+                         'A {nothing}')
+        self.assertEqual(render_template('No placeholders'),
+                         'No placeholders')
+        self.assertIsNone(render_template(None))
+
+    def test_instance_attributes(self):
+        params = {'0': 'first-page', 'title': 'param'}
+        cases = [
+            ('{title} at {path}', 'Exact at /exact/'),
+            ('{content_type.app_label}.{content_type.model}',
+             'painlessseo.seometadata'),
+            # Unknown attributes fall back to the params
+            ('{nothing}, {0}', '{nothing}, First Page'),
+            ('{title.nothing}', '{title.nothing}'),
+        ]
+        for string, expected in cases:
+            self.assertEqual(render_template(string, self.seometadata, 'en',
+                                             params), expected, string)
+
+        # Instances are only used together with a language
+        self.assertEqual(render_template('{title}', self.seometadata, None,
+                                         params), 'Param')
+
+    def test_missing_relation(self):
+        self.assertEqual(
+            render_template('{content_type.model}!', self.orphan, 'en'), '!')
+
+    def test_reverse_relation(self):
+        self.assertEqual(render_template('{seometadata_set.title}',
+                                         self.content_type, 'en'), 'Exact')
+
+    def test_translated_attributes(self):
+        instance = SimpleNamespace(name='Boots', name_es='Botas')
+        self.assertEqual(render_template('{name}', instance, 'es'), 'Botas')
+        self.assertEqual(render_template('{name}', instance, 'en'), 'Boots')
+
+    def test_format_metadata(self):
+        seo_context = {'1': 'blog'}
+        self.assertEqual(
+            format_metadata({'title': '{title} {0}', 'description': '{1}'},
+                            self.seometadata, 'en', ['page'], seo_context),
+            {'title': 'Exact Page', 'description': 'Blog'})
+        self.assertEqual(seo_context, {'1': 'blog'})
+
+
+class TemplatePlanTest(SeoTestCase):
+    def setUp(self):
+        super(TemplatePlanTest, self).setUp()
+        self.content_type = ContentType.objects.get_for_model(SeoMetadata)
+        self.create_metadata('/exact/', title='Exact',
+                             content_type=self.content_type, object_id=1)
+        self.seometadata = SeoMetadata.objects.get(path='/exact/')
+
+    def test_lookups(self):
+        cases = [
+            (SeoMetadata, '{content_type.model} {title} {0}',
+             (('content_type', ), ())),
+            (SeoMetadata, '{content_type.seometadata_set.title}',
+             (('content_type', ), ('content_type__seometadata_set', ))),
+            (ContentType, '{seometadata_set.title}',
+             ((), ('seometadata_set', ))),
+            (SeoMetadata, '{nothing.title} {title}', ((), ())),
+        ]
+        for model, string, plan in cases:
+            self.assertEqual(get_template_plan(model, string, 'en'), plan,
+                             string)
+
+    def test_prefetch_instance(self):
+        strings = ['{content_type.model}',
+                   '{content_type.seometadata_set.title}']
+        # One join for the foreign keys, and one query for the reverse
+        # relation
+        with self.assertNumQueries(2):
+            prefetch_instance(self.seometadata, strings, 'en')
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                [render_template(string, self.seometadata, 'en')
+                 for string in strings], ['seometadata', 'Exact'])
+
+    def test_deleted_instance(self):
+        SeoMetadata.objects.filter(pk=self.seometadata.pk).delete()
+        strings = ['{content_type.model}', '{title}']
+        with self.assertNumQueries(1):
+            prefetch_instance(self.seometadata, strings, 'en')
+        self.assertEqual([render_template(string, self.seometadata, 'en')
+                          for string in strings], ['seometadata', 'Exact'])
+
+    def test_instance_database(self):
+        strings = ['{content_type.model}']
+        self.assertEqual(self.seometadata._state.db, 'default')
+        with mock.patch.object(SeoMetadata._base_manager, 'using',
+                               wraps=SeoMetadata._base_manager.using) as using:
+            prefetch_instance(self.seometadata, strings, 'en')
+        using.assert_called_once_with('default')
+
+    def test_loaded_relations(self):
+        self.seometadata.content_type
+        with self.assertNumQueries(0):
+            prefetch_instance(self.seometadata, ['{content_type.model}'],
+                              'en')
+
+    def test_same_results(self):
+        result = {'title': '{content_type.seometadata_set.title} {0}',
+                  'description': '{content_type.model}'}
+        expected = dict(
+            (key, render_template(value, self.seometadata, 'en',
+                                  {'0': 'page'}))
+            for key, value in result.items())
+        self.assertEqual(format_metadata(
+            result, SeoMetadata.objects.get(path='/exact/'), 'en', ['page']),
+            expected)
+
+
+class ResolutionTestCase(SeoTestCase):
+    def setUp(self):
+        super(ResolutionTestCase, self).setUp()
+        self.create_metadata('/exact/', title='Exact')
+        self.create_metadata('/exact/', lang_code='es', title='Exacto')
+        self.create_metadata('/only-en/', title='Only english')
+        for path, priority in PATTERNS:
+            self.create_metadata(path, priority=priority, title='{0} page')
+        content_type = ContentType.objects.get_for_model(SeoMetadata)
+        self.instance = SeoMetadata.objects.get(path='/exact/',
+                                                lang_code='en')
+        self.create_metadata('/linked/', title='{title} linked',
+                             content_type=content_type,
+                             object_id=self.instance.pk)
+        SeoRegisteredModel.objects.create(
+            content_type=content_type, lang_code='en',
+            title='Registered {title}', description='Registered {0}')
+
+        self.items = []
+        for path in PATHS + ['/exact/', '/only-en/', '/linked/']:
+            for lang_code in ['en', 'es']:
+                self.items.append((path, lang_code, None))
+                self.items.append((path, lang_code, self.instance,
+                                   {'0': 'from-context'}))
+
+    def resolve_one_by_one(self):
+        return [get_path_metadata(*item) for item in self.items]
+
+
+class BatchResolutionTest(ResolutionTestCase):
+    def test_same_results(self):
+        expected = self.resolve_one_by_one()
+        self.assertEqual(
+            [expected[self.items.index(item)]['title'] for item in [
+                ('/linked/', 'es', None), ('/shop/boots/', 'es', None),
+                ('/nothing/', 'en', None)]],
+            ['Exact linked', 'Boots page', 'Default title'])
+        clear_seo_caches()
+        self.assertEqual(get_path_metadata_many(self.items), expected)
+
+    @override_settings(SEO_CACHE_ALIAS='seo')
+    def test_shared_cache(self):
+        caches['seo'].clear()
+        expected = self.resolve_one_by_one()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_path_metadata_many(self.items), expected)
+
+        caches['seo'].clear()
+        self.assertEqual(get_path_metadata_many(self.items), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.resolve_one_by_one(), expected)
+
+
+class AsyncResolutionTest(ResolutionTestCase):
+    async def test_same_results(self):
+        expected = await sync_to_async(self.resolve_one_by_one)()
+        await sync_to_async(clear_seo_caches)()
+        self.assertEqual([await aget_path_metadata(*item)
+                          for item in self.items], expected)
+
+    @override_settings(SEO_CACHE_ALIAS='seo')
+    async def test_shared_cache(self):
+        caches['seo'].clear()
+        expected = [await aget_path_metadata(*item) for item in self.items]
+        await sync_to_async(clear_seo_caches)()
+        self.assertEqual([await aget_path_metadata(*item)
+                          for item in self.items], expected)
+        self.assertEqual(await sync_to_async(self.resolve_one_by_one)(),
+                         expected)
+
+    async def test_request_metadata(self):
+        request = RequestFactory().get('/shop/boots/')
+        metadata = await seo.aget_request_metadata(
+            request, DetailView(self.instance))
+        self.assertEqual(metadata, await sync_to_async(get_path_metadata)(
+            '/shop/boots/', 'en', self.instance))
+
+        # The template tags of the page reuse it
+        context = Context({'request': request})
+        with mock.patch.object(seo, 'get_path_metadata') as resolve:
+            self.assertEqual(seo.get_seo(context), metadata)
+        resolve.assert_not_called()
+
+
+class ExportTest(SeoTestCase):
+    def setUp(self):
+        super(ExportTest, self).setUp()
+        self.create_metadata('/exact/', title='Exact')
+        self.create_metadata('/exact/', lang_code='es', title='Exacto')
+        self.create_metadata('/blog/{0}/')
+        content_type = ContentType.objects.get_for_model(SeoMetadata)
+        self.create_metadata('/linked/', title='{title} linked',
+                             content_type=content_type,
+                             object_id=SeoMetadata.objects.get(
+                                 path='/exact/', lang_code='es').pk)
+
+        handle, self.filename = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        self.addCleanup(os.remove, self.filename)
+
+    def get_expected(self, lang_codes=('en', 'es')):
+        expected = []
+        for path, lang_code in SeoMetadata.objects.filter(
+                has_parameters=False, lang_code__in=lang_codes).order_by(
+                'id').values_list('path', 'lang_code'):
+            row = {'path': path, 'lang_code': lang_code}
+            row.update(get_path_metadata(path, lang_code))
+            expected.append(row)
+        return expected
+
+    def test_same_as_resolving_paths(self):
+        rows = list(iter_resolved_metadata(chunk_size=2))
+        self.assertEqual(rows, self.get_expected())
+        self.assertEqual(rows[-1]['title'], 'Exacto linked')
+
+    def test_command(self):
+        call_command('export_seo_metadata', output=self.filename,
+                     export_langs='es', chunk_size=1)
+        with open(self.filename, encoding='utf-8') as output:
+            self.assertEqual([json.loads(line) for line in output],
+                             self.get_expected(['es']))
+
+        call_command('export_seo_metadata', '--format=csv',
+                     '--output=%s' % self.filename)
+        with open(self.filename, encoding='utf-8') as output:
+            self.assertEqual(
+                output.read().splitlines(),
+                ['path,lang_code,title,description',
+                 '/exact/,en,Exact,About /exact/',
+                 '/exact/,es,Exacto,About /exact/',
+                 '/linked/,en,Exacto linked,About /linked/'])
+
+    def test_command_stdout(self):
+        stdout = StringIO()
+        call_command('export_seo_metadata', export_langs='es', stdout=stdout)
+        self.assertEqual([json.loads(line)
+                          for line in stdout.getvalue().splitlines()],
+                         self.get_expected(['es']))
+
+
+class DetailView(object):
+    def __init__(self, instance):
+        self.object = instance
+
+    def get_object(self):
+        raise AssertionError('The object was already loaded by the view')
+
+
+class TemplateTagTest(SeoTestCase):
+    def setUp(self):
+        super(TemplateTagTest, self).setUp()
+        self.create_metadata('/exact/', title='Exact', description='Hello')
+        self.create_metadata('/exact/', lang_code='es', title='Exacto',
+                             description='Hola')
+        self.request = RequestFactory().get('/exact/')
+
+    def test_resolved_once_per_request(self):
+        context = Context({'request': self.request})
+        with mock.patch.object(seo, 'get_path_metadata',
+                               wraps=seo.get_path_metadata) as resolve:
+            self.assertEqual(seo.get_seo_title(context), 'Exact')
+            self.assertEqual(seo.get_seo_description(context), 'Hello')
+            self.assertEqual(seo.get_seo(context),
+                             {'title': 'Exact', 'description': 'Hello'})
+            with translation.override('es'):
+                self.assertEqual(seo.get_seo_title(context), 'Exacto')
+                self.assertEqual(seo.get_seo_title(context), 'Exacto')
+        self.assertEqual(resolve.call_count, 2)
+
+    def test_reuses_view_object(self):
+        instance = SeoMetadata.objects.get(path='/exact/', lang_code='en')
+        context = Context({'request': self.request,
+                           'view': DetailView(instance)})
+        with mock.patch.object(seo, 'get_path_metadata',
+                               wraps=seo.get_path_metadata) as resolve:
+            seo.get_seo_title(context)
+        resolve.assert_called_once_with(
+            path='/exact/', lang_code='en', instance=instance,
+            seo_context={})
+
+
+def get_content_type_url(content_type):
+    return '/types/%s/' % content_type.model
+
+
+@mock.patch.object(ContentType, 'get_absolute_url', get_content_type_url,
+                   create=True)
+class BulkUpdateTest(SeoTestCase):
+    """
+    Uses content types as the synced instances, as they are always
+    installed.
+    """
+
+    def setUp(self):
+        super(BulkUpdateTest, self).setUp()
+        self.first = ContentType.objects.get_for_model(SeoMetadata)
+        self.second = ContentType.objects.get_for_model(SeoRegisteredModel)
+        self.content_type = ContentType.objects.get_for_model(ContentType)
+        self.create_metadata('/stale/', content_type=self.content_type,
+                             object_id=self.first.pk)
+
+    def get_paths(self, instance):
+        return list(SeoMetadata.objects.filter(
+            content_type=self.content_type, object_id=instance.pk).order_by(
+            'lang_code').values_list('lang_code', 'path'))
+
+    def test_creates_and_updates(self):
+        instances = [self.first, self.second]
+        self.assertEqual(bulk_update_seo(ContentType, instances,
+                                         auto_languages=['es']), (2, 1))
+        self.assertEqual(self.get_paths(self.first),
+                         [('en', '/types/seometadata/'),
+                          ('es', '/types/seometadata/')])
+        self.assertEqual(self.get_paths(self.second),
+                         [('es', '/types/seoregisteredmodel/')])
+        self.assertEqual(get_path_metadata('/types/seometadata/', 'en')[
+            'title'], '/stale/')
+
+        # Nothing written, the per process caches are kept
+        pattern_index = get_pattern_index('en')
+        self.assertEqual(bulk_update_seo(ContentType, instances,
+                                         auto_languages=['es']), (0, 0))
+        self.assertIs(get_pattern_index('en'), pattern_index)
+
+
+@override_settings(SEO_DEFER_UPDATES=True)
+@mock.patch.object(ContentType, 'get_absolute_url', get_content_type_url,
+                   create=True)
+class DeferredUpdateTest(SeoTestCase):
+    def setUp(self):
+        super(DeferredUpdateTest, self).setUp()
+        self.first = ContentType.objects.get_for_model(SeoMetadata)
+        self.second = ContentType.objects.get_for_model(SeoRegisteredModel)
+        for instance in [self.first, self.second]:
+            self.create_metadata(
+                '/stale/', content_type=ContentType.objects.get_for_model(
+                    instance), object_id=instance.pk)
+
+    def get_path(self, instance):
+        return SeoMetadata.objects.get(
+            content_type=ContentType.objects.get_for_model(instance),
+            object_id=instance.pk).path
+
+    def test_synced_once_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                defer_update_seo(self.first)
+                defer_update_seo(self.second)
+                defer_update_seo(self.first)
+                self.assertEqual(self.get_path(self.first), '/stale/')
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.get_path(self.first), '/types/seometadata/')
+        self.assertEqual(self.get_path(self.second),
+                         '/types/seoregisteredmodel/')
+
+    def test_discarded_on_rollback(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    defer_update_seo(self.first)
+                    raise ValueError
+            except ValueError:
+                pass
+
+            with transaction.atomic():
+                defer_update_seo(self.second)
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.get_path(self.first), '/stale/')
+        self.assertEqual(self.get_path(self.second),
+                         '/types/seoregisteredmodel/')
+
+    def test_savepoint_rolled_back(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                defer_update_seo(self.first)
+                try:
+                    with transaction.atomic():
+                        defer_update_seo(self.second)
+                        raise ValueError
+                except ValueError:
+                    pass
+
+        self.assertEqual(self.get_path(self.first), '/types/seometadata/')
+        self.assertEqual(self.get_path(self.second), '/stale/')
+
+
+class SyncModelsTest(SeoTestCase):
+    @skipUnless(connection.vendor == 'sqlite', 'Needs a SQLite database')
+    def test_workers_on_sqlite(self):
+        with self.assertRaises(CommandError):
+            call_command('sync_seo_models', workers=2)
+
+
+class UpdateContentTest(SeoTestCase):
+    def test_copies_base_language(self):
+        self.create_metadata('/z/', title='Z', view_name='home')
+        self.create_metadata('/a/', title='A', view_name='home')
+        content_type = ContentType.objects.get_for_model(ContentType)
+        SeoRegisteredModel.objects.create(
+            content_type=content_type, lang_code='en', title='Type')
+
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            call_command('update_seo_content',
+                         seo_models='contenttypes.ContentType')
+        # The first one in the Meta ordering
+        self.assertEqual(list(SeoMetadata.objects.filter(
+            lang_code='es').values_list('view_name', 'path', 'title')),
+            [('home', '/a/', 'A')])
+        self.assertEqual(list(SeoRegisteredModel.objects.filter(
+            lang_code='es').values_list('content_type', 'title')),
+            [(content_type.pk, 'Type')])
+
+
+class OrphanedMetadataTest(SeoTestCase):
+    def setUp(self):
+        super(OrphanedMetadataTest, self).setUp()
+        self.content_type = ContentType.objects.get_for_model(ContentType)
+        last = ContentType.objects.order_by('pk').last()
+        self.create_metadata('/existing/', content_type=self.content_type,
+                             object_id=last.pk)
+        self.create_metadata('/orphan/', content_type=self.content_type,
+                             object_id=last.pk + 1)
+        self.create_metadata('/path/')
+
+    def get_paths(self):
+        return sorted(SeoMetadata.objects.values_list('path', flat=True))
+
+    def test_deletes_orphans(self):
+        self.assertEqual(delete_orphaned_seo(ContentType), 1)
+        self.assertEqual(self.get_paths(), ['/existing/', '/path/'])
+        self.assertEqual(delete_orphaned_seo(ContentType), 0)
+
+    def test_without_object_id(self):
+        self.create_metadata('/no-object/', content_type=self.content_type)
+        self.assertEqual(delete_orphaned_seo(ContentType), 1)
+        self.assertIn('/no-object/', self.get_paths())
+
+    @mock.patch('painlessseo.utils.ORPHANS_CHUNK_SIZE', 1)
+    def test_chunks(self):
+        last = ContentType.objects.order_by('pk').last()
+        self.create_metadata('/orphan/', lang_code='es',
+                             content_type=self.content_type,
+                             object_id=last.pk + 2)
+        pattern_index = get_pattern_index('en')
+        # The orphans query, then a delete() per chunk
+        with self.assertNumQueries(1 + 2 * 2):
+            self.assertEqual(delete_orphaned_seo(ContentType), 2)
+        self.assertEqual(self.get_paths(), ['/existing/', '/path/'])
+        # Deleted with signals
+        self.assertIsNot(get_pattern_index('en'), pattern_index)
+
+    def test_command(self):
+        with mock.patch('sys.stdout', new_callable=StringIO) as stdout:
+            call_command('delete_orphaned_seo',
+                         models='contenttypes.ContentType')
+        self.assertIn('1 orphaned metadatas deleted', stdout.getvalue())
+        self.assertEqual(self.get_paths(), ['/existing/', '/path/'])
+
+
+class RenderMetadataTest(SeoTestCase):
+    def test_same_as_template(self):
+        cases = [
+            ('Title', 'Description'),
+            (None, None),
+            ('', 'Only description'),
+            ('Fish & <b>chips</b>', 'Say "cheese" & \'bye\' <br>'),
+            ('  Spaces\n\tand   lines  ', '\n Spaces  and\tlines \n'),
+            ('Long title ' * 10, 'Long description ' * 20),
+            ('x' * 70, '"' * 160),
+            ('Título ñ', 'Descripción'),
+        ]
+        for title, description in cases:
+            self.assertEqual(
+                seo.render_metadata(title, description),
+                render_to_string('painlessseo/metadata.html', {
+                    'title': title, 'description': description}),
+                (title, description))
+
+    def test_tag(self):
+        self.create_metadata('/exact/', title='Fish & chips',
+                             description='The "best" ones')
+        request = RequestFactory().get('/exact/')
+        self.assertEqual(
+            Template('{% load seo %}{% get_seo_html %}').render(
+                Context({'request': request})),
+            Template('{% load seo %}{% get_seo %}').render(
+                Context({'request': request})))
+
+
+@override_settings(SEO_STATS=True)
+class StatsTest(SeoTestCase):
+    def setUp(self):
+        super(StatsTest, self).setUp()
+        stats.reset_stats()
+        self.addCleanup(stats.reset_stats)
+        self.create_metadata('/exact/', title='Exact')
+        self.create_metadata('/blog/{0}/')
+        self.content_type = ContentType.objects.get_for_model(SeoMetadata)
+        SeoRegisteredModel.objects.create(
+            content_type=self.content_type, lang_code='en',
+            title='Registered', description='Registered')
+
+    def test_tiers(self):
+        instance = SeoMetadata.objects.get(path='/exact/')
+        calls = [
+            ('/exact/', 'en', None, stats.TIER_EXACT),
+            ('/exact/', 'es', None, stats.TIER_LANGUAGE),
+            ('/blog/first/', 'en', None, stats.TIER_PARAMETERIZED),
+            ('/page/', 'en', instance, stats.TIER_REGISTERED_MODEL),
+            ('/page/', 'en', None, stats.TIER_FALLBACK),
+        ]
+        resolved = []
+
+        def receiver(sender, **kwargs):
+            resolved.append((kwargs['path'], kwargs['tier'],
+                             kwargs['queries']))
+
+        stats.metadata_resolved.connect(receiver)
+        self.addCleanup(stats.metadata_resolved.disconnect, receiver)
+        for path, lang_code, instance, tier in calls:
+            get_path_metadata(path, lang_code, instance)
+        self.assertEqual([(path, tier) for path, tier, queries in resolved],
+                         [(path, tier) for path, lang_code, instance, tier
+                          in calls])
+        self.assertTrue(all(queries >= 1 for path, tier, queries
+                            in resolved))
+
+        found = stats.get_stats()
+        self.assertEqual([row['tier'] for row in found], [
+            stats.TIER_EXACT, stats.TIER_LANGUAGE,
+            stats.TIER_REGISTERED_MODEL, stats.TIER_PARAMETERIZED,
+            stats.TIER_FALLBACK])
+        self.assertEqual([row['calls'] for row in found], [1] * 5)
+
+    @override_settings(SEO_CACHE_ALIAS='seo')
+    def test_cache_tier(self):
+        caches['seo'].clear()
+        get_path_metadata('/exact/', 'en')
+        get_path_metadata('/exact/', 'en')
+        self.assertEqual(
+            [(row['tier'], row['calls'], row['queries'])
+             for row in stats.get_stats()],
+            [(stats.TIER_CACHE, 1, 0), (stats.TIER_EXACT, 1, 1)])
+
+
+@skipUnless(apps.is_installed('django.contrib.admin'),
+            'django.contrib.admin is not installed')
+class StatsAdminTest(SeoTestCase):
+    def setUp(self):
+        super(StatsAdminTest, self).setUp()
+        stats.reset_stats()
+        self.addCleanup(stats.reset_stats)
+        self.model_admin = SeoMetadataAdmin(SeoMetadata, AdminSite())
+        self.user = User.objects.create_user('staff', is_staff=True)
+        self.add_permission('view_seometadata')
+
+    def add_permission(self, codename):
+        self.user.user_permissions.add(Permission.objects.get(
+            content_type__app_label='painlessseo', codename=codename))
+
+    def get_response(self, method):
+        request = getattr(RequestFactory(), method)(
+            '/admin/painlessseo/seometadata/stats/')
+        # Loaded again, so permissions aren't cached
+        request.user = User.objects.get(pk=self.user.pk)
+        return self.model_admin.stats_view(request)
+
+    def test_view(self):
+        stats.record('/exact/', 'en', stats.TIER_EXACT, 0.001, 1)
+        response = self.get_response('get')
+        self.assertEqual(response.template_name,
+                         'admin/painlessseo/seometadata/stats.html')
+        self.assertEqual([row['tier'] for row in response.context_data[
+            'stats']], [stats.TIER_EXACT])
+
+    def test_reset(self):
+        stats.record('/exact/', 'en', stats.TIER_EXACT, 0.001, 1)
+        self.assertFalse(self.get_response('get').context_data['can_reset'])
+        # Needs the change permission
+        with self.assertRaises(PermissionDenied):
+            self.get_response('post')
+        self.assertEqual(len(stats.get_stats()), 1)
+
+        self.add_permission('change_seometadata')
+        self.assertTrue(self.get_response('get').context_data['can_reset'])
+        response = self.get_response('post')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(stats.get_stats(), [])
+
+    def test_permission(self):
+        self.user.user_permissions.clear()
+        with self.assertRaises(PermissionDenied):
+            self.get_response('get')
+
+
+class SettingsTest(SeoTestCase):
+    def test_follow_django_settings(self):
+        self.assertEqual(settings.FALLBACK_TITLE,
+                         {'en': 'Default title', 'es': 'Titulo'})
+        with override_settings(DEFAULT_SEO_TITLES='Only title',
+                               LANGUAGE_CODE='es'):
+            self.assertEqual(settings.DEFAULT_LANG_CODE, 'es')
+            self.assertEqual(settings.FALLBACK_TITLE, {'es': 'Only title'})
+            self.assertEqual(get_path_metadata('/nothing/', 'en')['title'],
+                             'Only title')
+        self.assertEqual(settings.DEFAULT_LANG_CODE, 'en')
+
+    def test_invalid_fallbacks(self):
+        cases = [None, ['Title'], {'es': 'Titulo'}, {'en': []}, {'en': 1},
+                 {'en': ['Title', None]}]
+        for fallback in cases:
+            with override_settings(DEFAULT_SEO_TITLES=fallback):
+                with self.assertRaises(ImproperlyConfigured):
+                    settings.FALLBACK_TITLE
+        # Checked on startup
+        with override_settings(DEFAULT_SEO_DESCRIPTIONS=None):
+            with self.assertRaises(ImproperlyConfigured):
+                apps.get_app_config('painlessseo').ready()
+
+    @override_settings(SEO_MODELS=[('contenttypes', 'ContentType')])
+    @mock.patch.object(ContentType, 'get_absolute_url', get_content_type_url,
+                       create=True)
+    def test_register_signals(self):
+        with self.assertNumQueries(0):
+            register_seo_signals()
+        self.addCleanup(signals.post_save.disconnect, sender=ContentType,
+                        dispatch_uid='painlessseo_contenttypes_contenttype'
+                        '_update')
+        self.addCleanup(signals.pre_delete.disconnect, sender=ContentType,
+                        dispatch_uid='painlessseo_contenttypes_contenttype'
+                        '_delete')
+
+        instance = ContentType.objects.get_for_model(SeoMetadata)
+        self.create_metadata(
+            '/stale/', content_type=ContentType.objects.get_for_model(
+                ContentType), object_id=instance.pk)
+        instance.save()
+        self.assertEqual(SeoMetadata.objects.get(object_id=instance.pk).path,
+                         '/types/seometadata/')
+
+    def test_invalid_models(self):
+        # Not installed, and without get_absolute_url
+        for model in ['Nothing', 'SeoRegisteredModel']:
+            with override_settings(SEO_MODELS=[('painlessseo', model)]):
+                with self.assertRaises(ImproperlyConfigured):
+                    register_seo_signals()
+
+
+class RoutingFileTest(SeoTestCase):
+    def setUp(self):
+        super(RoutingFileTest, self).setUp()
+        self.create_metadata('/exact/', title='Exact')
+        self.create_metadata('/exact/', lang_code='es', title='Exacto')
+        self.create_metadata('/only-en/', title='Only english')
+        self.create_metadata('/accents/', title='Título {0}',
+                             description=None)
+        for path, priority in PATTERNS:
+            self.create_metadata(path, priority=priority)
+        self.content_type = ContentType.objects.get_for_model(SeoMetadata)
+        SeoRegisteredModel.objects.create(
+            content_type=self.content_type, lang_code='en',
+            title='Registered', description='Registered description')
+
+        handle, self.filename = tempfile.mkstemp(suffix='.routes')
+        os.close(handle)
+        self.addCleanup(os.remove, self.filename)
+        self.addCleanup(check_routing_file)
+        compile_routes(self.filename)
+
+    def test_round_trip(self):
+        table = RoutingTable(self.filename)
+        for seometadata in SeoMetadata.objects.filter(has_parameters=False):
+            records = table.get_exact(seometadata.path, seometadata.lang_code)
+            self.assertEqual([get_record_fields(record) for record in records],
+                             [get_record_fields(seometadata)])
+        self.assertEqual(table.get_exact('/only-en/', 'es'), [])
+        self.assertEqual(table.get_exact('/nothing/', 'en'), [])
+
+        for path in PATHS:
+            self.assertEqual(
+                [(match['seometadata'].id, match['groups'])
+                 for match in table.get_pattern_index('en').match(path)],
+                [(match['seometadata'].id, match['groups'])
+                 for match in PatternIndex(get_metadata_records(
+                     SeoMetadata.objects.filter(
+                         has_parameters=True, lang_code='en'))).match(path)])
+
+        pool = table.get_pool(self.content_type.id, 'en')
+        self.assertEqual([(record.title, record.description)
+                          for record in pool],
+                         [('Registered', 'Registered description')])
+
+    def test_resolves_like_database(self):
+        paths = PATHS + ['/exact/', '/only-en/', '/accents/']
+        expected = [get_path_metadata(path, lang_code)
+                    for path in paths for lang_code in ['en', 'es']]
+        with override_settings(SEO_ROUTING_FILE=self.filename):
+            check_routing_file()
+            with self.assertNumQueries(0):
+                found = [get_path_metadata(path, lang_code)
+                         for path in paths for lang_code in ['en', 'es']]
+        self.assertEqual(found, expected)
+
+    @override_settings(SEO_NEGATIVE_CACHE_SIZE=10)
+    def test_new_file_clears_misses(self):
+        with override_settings(SEO_ROUTING_FILE=self.filename):
+            check_routing_file()
+            table = get_routing_table()
+            is_known_miss('/new/', 'en')
+            add_known_miss('/new/', 'en')
+            self.assertTrue(is_known_miss('/new/', 'en'))
+
+            # Replaced by another process, without signals
+            compile_routes(self.filename)
+            check_routing_file()
+            self.assertIsNot(get_routing_table(), table)
+            self.assertFalse(is_known_miss('/new/', 'en'))
+
+    @override_settings(SEO_CACHE_ALIAS='seo', SEO_NEGATIVE_CACHE_SIZE=10)
+    def test_command(self):
+        caches['seo'].clear()
+        self.create_metadata('/new/', title='New')
+        versions = get_versions()
+        is_known_miss('/other/', 'en')
+        add_known_miss('/other/', 'en')
+        self.assertTrue(is_known_miss('/other/', 'en'))
+        with override_settings(SEO_ROUTING_FILE=self.filename):
+            with mock.patch('sys.stdout', new_callable=StringIO):
+                call_command('compile_seo_routes', chunk_size=2)
+        self.assertEqual([record.title for record in RoutingTable(
+            self.filename).get_exact('/new/', 'en')], ['New'])
+
+        # The caches of every process are cleared
+        self.assertFalse(is_known_miss('/other/', 'en'))
+        new_versions = get_versions()
+        self.assertNotEqual(new_versions.metadata, versions.metadata)
+        self.assertNotEqual(new_versions.models, versions.models)
+
+
+@override_settings(SEO_CACHE_ALIAS='seo', ROOT_URLCONF='painlessseo.test')
+class WarmCacheTest(SeoTestCase):
+    def setUp(self):
+        super(WarmCacheTest, self).setUp()
+        caches['seo'].clear()
+        self.create_metadata('/exact/', title='Exact')
+        self.create_metadata('/exact/', lang_code='es', title='Exacto')
+        self.create_metadata('/types/{0}/', title='{model} type')
+        self.content_type = ContentType.objects.get_for_model(SeoMetadata)
+        self.type_path = '/types/%d/' % self.content_type.pk
+
+        handle, self.filename = tempfile.mkstemp(suffix='.log')
+        os.close(handle)
+        self.addCleanup(os.remove, self.filename)
+
+    def warm(self, lines, **options):
+        with open(self.filename, 'w') as input_file:
+            input_file.write('\n'.join(lines) + '\n')
+        with mock.patch('sys.stdout', new_callable=StringIO) as stdout:
+            call_command('warm_seo_cache', input=self.filename, **options)
+        return stdout.getvalue()
+
+    def test_warms_paths(self):
+        output = self.warm([
+            '127.0.0.1 - - [01/Jan/2015:00:00:00 +0000] '
+            '"GET /exact/?page=2 HTTP/1.1" 200 512',
+            '127.0.0.1 - - [01/Jan/2015:00:00:01 +0000] '
+            '"GET /missing/ HTTP/1.1" 404 512',
+            '/exact/ es',
+            '/exact/',
+        ])
+        self.assertTrue(output.startswith('2 paths warmed'))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_path_metadata('/exact/', 'en')['title'],
+                             'Exact')
+            self.assertEqual(get_path_metadata('/exact/', 'es')['title'],
+                             'Exacto')
+
+    def test_top(self):
+        self.warm(['/exact/', '/exact/', '/nothing/'], top=1)
+        with self.assertNumQueries(0):
+            get_path_metadata('/exact/', 'en')
+        with CaptureQueriesContext(connection) as queries:
+            get_path_metadata('/nothing/', 'en')
+        self.assertTrue(queries.captured_queries)
+
+    def test_resolve_views(self):
+        self.warm([self.type_path])
+        with self.assertNumQueries(0):
+            metadata = get_path_metadata(self.type_path, 'en',
+                                         self.content_type)
+        self.assertEqual(metadata['title'], 'seometadata type')
+
+    @skipUnless(apps.is_installed('django.contrib.auth'),
+                'django.contrib.auth is not installed')
+    def test_anonymous_user(self):
+        self.create_metadata('/visitors/{0}/', title='Hello {1}')
+        path = '/visitors/%d/' % self.content_type.pk
+        self.warm([path])
+        with self.assertNumQueries(0):
+            metadata = get_path_metadata(path, 'en', self.content_type,
+                                         {'1': 'guest'})
+        self.assertEqual(metadata['title'], 'Hello Guest')
+
+    def test_failed_views(self):
+        output = self.warm(['/broken/', '/exact/'])
+        self.assertIn("View of /broken/ (en) failed: ValueError('Broken "
+                      "view')", output)
+        self.assertIn('1 of them without their view', output)
+        with self.assertNumQueries(0):
+            get_path_metadata('/broken/', 'en')
+            get_path_metadata('/exact/', 'en')
+
+    def test_no_resolve_views(self):
+        self.warm([self.type_path], resolve_views=False)
+        with self.assertNumQueries(0):
+            get_path_metadata(self.type_path, 'en')
+        with CaptureQueriesContext(connection) as queries:
+            get_path_metadata(self.type_path, 'en', self.content_type)
+        self.assertTrue(queries.captured_queries)
+
+    def test_without_cache(self):
+        with override_settings(SEO_CACHE_ALIAS=None):
+            with self.assertRaises(CommandError):
+                self.warm(['/exact/'])
+
+
+class MissesTest(SeoTestCase):
+    def test_bloom_filter(self):
+        bloom_filter = BloomFilter(1000, error_rate=0.01)
+        paths = ['/page-%d/' % number for number in range(1000)]
+        for path in paths:
+            bloom_filter.add(path)
+
+        # Never wrong about the added strings
+        self.assertTrue(all(path in bloom_filter for path in paths))
+        false_positives = sum('/other-%d/' % number in bloom_filter
+                              for number in range(10000))
+        self.assertLess(false_positives, 300)
+
+    @override_settings(SEO_EXACT_FILTER=True)
+    def test_exact_filter_follows_saves(self):
+        self.create_metadata('/exact/')
+        self.assertEqual(get_possible_lang_codes('/exact/', ['en', 'es']),
+                         ['en'])
+        self.assertEqual(get_possible_lang_codes('/new/', ['en']), [])
+
+        self.create_metadata('/new/', title='New')
+        self.assertEqual(get_possible_lang_codes('/new/', ['en']), ['en'])
+        self.assertEqual(get_path_metadata('/new/', 'en')['title'], 'New')
+
+    @override_settings(SEO_NEGATIVE_CACHE_SIZE=2)
+    def test_negative_cache(self):
+        fallback = get_path_metadata('/missing/', 'en')
+        self.assertTrue(is_known_miss('/missing/', 'en'))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_path_metadata('/missing/', 'en'), fallback)
+
+        # Only the last SEO_NEGATIVE_CACHE_SIZE paths are kept
+        add_known_miss('/second/', 'en')
+        add_known_miss('/third/', 'en')
+        self.assertFalse(is_known_miss('/missing/', 'en'))
+        self.assertTrue(is_known_miss('/third/', 'en'))
+
+        self.create_metadata('/third/', title='Third')
+        self.assertFalse(is_known_miss('/third/', 'en'))
+        self.assertEqual(get_path_metadata('/third/', 'en')['title'],
+                         'Third')
+
+    @override_settings(SEO_EXACT_FILTER=True, SEO_NEGATIVE_CACHE_SIZE=2,
+                       SEO_INDEX_TIMEOUT=0)
+    def test_own_timeout(self):
+        exact_filter = get_exact_filter('en')
+        get_path_metadata('/missing/', 'en')
+        # Not rebuilt with the pattern index
+        self.assertIs(get_exact_filter('en'), exact_filter)
+        with self.assertNumQueries(0):
+            get_path_metadata('/missing/', 'en')
+
+        with override_settings(SEO_MISSES_TIMEOUT=0):
+            self.assertIsNot(get_exact_filter('en'), exact_filter)
+            self.assertFalse(is_known_miss('/missing/', 'en'))
+
+    def test_same_results(self):
+        self.create_metadata('/exact/', title='Exact')
+        self.create_metadata('/exact/', lang_code='es', title='Exacto')
+        self.create_metadata('/only-en/', title='Only english')
+        for path, priority in PATTERNS:
+            self.create_metadata(path, priority=priority)
+        paths = PATHS + ['/exact/', '/only-en/'] + PATHS
+
+        expected = [get_path_metadata(path, lang_code)
+                    for path in paths for lang_code in ['en', 'es']]
+        with override_settings(SEO_EXACT_FILTER=True,
+                               SEO_NEGATIVE_CACHE_SIZE=100):
+            found = [get_path_metadata(path, lang_code)
+                     for path in paths for lang_code in ['en', 'es']]
+        self.assertEqual(found, expected)
+
+
+class RecordTest(SeoTestCase):
+    def test_slots(self):
+        for record in [MetadataRecord(1, '/', 'en', 'T', 'D', 0, None, None,
+                                      False),
+                       RegisteredModelRecord(1, 2, 'en', 'T', 'D')]:
+            self.assertFalse(hasattr(record, '__dict__'))
+            with self.assertRaises(AttributeError):
+                record.other = True
+
+    def test_interned_strings(self):
+        strings = {}
+        # Equal strings built separately, as read from the database
+        first, second = [MetadataRecord.from_row(
+            (number, '/page-%d/' % number, 'en', ''.join(['Ti', 'tle']),
+             'D', 0, None, None, 0), strings) for number in range(2)]
+        self.assertIs(first.title, second.title)
+        self.assertIs(first.has_parameters, False)
+
+    def test_same_fields_as_model(self):
+        self.create_metadata('/exact/', title='Exact', description=None)
+        self.create_metadata('/blog/{0}/', lang_code='es', priority=3)
+        metadatas = SeoMetadata.objects.order_by('id')
+        records = get_metadata_records(metadatas, {})
+        self.assertEqual([get_record_fields(record) for record in records],
+                         [get_record_fields(seometadata)
+                          for seometadata in metadatas])
+        self.assertEqual([record.get_metadata() for record in records],
+                         [seometadata.get_metadata()
+                          for seometadata in metadatas])
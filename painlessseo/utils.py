@@ -1,20 +1,49 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from painlessseo import settings
-from painlessseo.models import SeoMetadata
+from painlessseo import settings, stats
+from painlessseo.cache import (
+    aget_cached_result, aget_versions, aset_cached_result,
+    build_cache_entry, bump_instance_versions, bump_metadata_version,
+    bump_models_version, get_cached_result, get_entries_version_keys,
+    get_fresh_result, get_instance_key, get_instance_versions,
+    get_metadata_key, get_seo_cache, get_versioned_object, get_versions,
+    set_cached_result)
+from painlessseo.formatting import (
+    prefetch_instance, prefetch_instances_many, render_template)
+from painlessseo.index import (
+    aget_pattern_index, aget_registered_pool, clear_pattern_indexes,
+    clear_registered_pools, get_pattern_index, get_path_regex,
+    get_registered_pool)
+from painlessseo.misses import (
+    add_known_miss, aget_possible_lang_codes, ais_known_miss, clear_misses,
+    get_possible_lang_codes, is_known_miss)
+from painlessseo.models import RESOLVER_FIELDS, SeoMetadata
+from painlessseo.routing import check_routing_file
+from painlessseo.snapshot import aget_snapshot, bump_generation, get_snapshot
+from asgiref.sync import sync_to_async
+from django.apps import apps
 from django.core.exceptions import ImproperlyConfigured
 from django.utils.translation import activate, get_language
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
-from django.db.models import Q
-from painlessseo.models import SeoRegisteredModel
-from django.utils.encoding import smart_text, smart_str
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.models import Case, Value, When
+from django.utils.encoding import smart_str
+from functools import partial
+from itertools import islice
 from urllib.parse import urlparse
 
-import random
+import asyncio
 import re
 import hashlib
+import threading
+import time
+
+# Instances saved in the current thread, waiting for the transaction to end:
+# _deferred.pending = {database alias: (transaction key, {(ctype, pk)})}
+_deferred = threading.local()
+DEFERRED_CHUNK_SIZE = 1000
+ORPHANS_CHUNK_SIZE = 1000
 
 
 def get_fallback_metadata(lang_code, index=0):
@@ -41,14 +70,28 @@ def get_fallback_metadata(lang_code, index=0):
         }
 
 
-def get_instance_metadata(instance, lang_code):
+def get_stable_index(instance):
+    # Integer primary keys are used as they are, others are hashed
+    if isinstance(instance.pk, int):
+        return instance.pk
+    return int(hashlib.md5(
+        smart_str(instance.pk).encode('utf-8')).hexdigest(), 16)
+
+
+def get_instance_metadata(instance, lang_code, versions=None):
     if instance:
         ctype = ContentType.objects.get_for_model(instance)
-        available_metadata = SeoRegisteredModel.objects.filter(
-            content_type=ctype, lang_code=lang_code).order_by('id')
+        snapshot = get_snapshot(versions)
+        if snapshot is not None:
+            available_metadata = snapshot.get_pool(ctype.id, lang_code)
+        else:
+            available_metadata = get_registered_pool(ctype.id, lang_code,
+                                                     versions)
 
-        if available_metadata.exists():
-            choosen = random.choice(available_metadata)
+        if available_metadata:
+            # Always the same one for the same instance
+            choosen = available_metadata[
+                get_stable_index(instance) % len(available_metadata)]
             return {
                 'title': choosen.title,
                 'description': choosen.description,
@@ -57,87 +100,42 @@ def get_instance_metadata(instance, lang_code):
 
 def format_metadata(result, instance=None, lang_code=None, path_args=[],
                     seo_context={}):
-    formatted_metadata = {}
-    path_context = {}
+    params = dict(seo_context)
     for index in range(0, len(path_args)):
-        path_context[str(index)] = path_args[index]
-    seo_context.update(path_context)
+        params[str(index)] = path_args[index]
+
+    if instance and lang_code:
+        # Load every related object used by the placeholders at once
+        prefetch_instance(instance, result.values(), lang_code)
+
+    # Instance attributes used by several fields are only resolved once
+    values = {}
+    formatted_metadata = {}
     for meta_key, meta_value in result.items():
-        # First format using the instance
-        instance_string = format_from_instance(
-            string=meta_value,
-            instance=instance,
-            lang_code=lang_code)
-        # Then format using the context
-        formatted_metadata[meta_key] = format_from_params(
-            string=instance_string,
-            **seo_context)
+        # Format using the instance first and then using the context
+        formatted_metadata[meta_key] = render_template(
+            meta_value, instance=instance, lang_code=lang_code,
+            params=params, values=values)
 
     return formatted_metadata
 
 
 def format_from_params(string, **kwargs):
     # Format using parameters
-    result = string
-    if kwargs:
-        for name, value in kwargs.iteritems():
-            param_name = r'\{\s*%s\s*\}' % (name)
-            if re.search(param_name, result) is not None:
-                # De-slugify
-                value = re.sub('-', ' ', smart_text(value)).title()
-                # Update the content
-                result = re.sub(param_name, value, result)
-
-    return result
+    return render_template(string, params=kwargs)
 
 
 def format_from_instance(string, instance=None, lang_code=None):
     # Now substitute parameters {XX} by instance.XX (only for instance based
-    result = string
-    if instance and lang_code:
-        matches = re.findall(r"\{\s*([^\}\s]+)\s*\}", string)
-        if matches:
-            for match in matches:
-                # For each field, check if exists the one for the language
-                attrs = match.split('.')
-                base = instance
-                found = True
-                for attr in attrs:
-                    field_lang = "%s_%s" % (attr, lang_code)
-                    if hasattr(base, field_lang):
-                        attr_name = field_lang
-                    elif hasattr(base, attr):
-                        attr_name = attr
-                    elif base is None:
-                        # In case is a foreign key with 'None' value
-                        # We can't go deeper, but we found the attr
-                        attr_value = None
-                        break
-                    else:
-                        # Attr not found, so let it like it is
-                        found = False
-                        break
-
-                    attr_value = getattr(base, attr_name)
-                    if hasattr(attr_value, 'get'):
-                        base = attr_value.get()
-                    else:
-                        base = attr_value
-
-                if found:
-                    result = re.sub(
-                        r"\{\s*%s\s*\}" % match,
-                        str(attr_value or ''),
-                        result)
-    return result
+    return render_template(string, instance=instance, lang_code=lang_code)
 
 
 def get_abstract_matches(path, metadatas):
+    # Linear scan, get_pattern_index(lang_code).match() is the indexed
+    # equivalent used when resolving paths.
     matches = []
     for abs_seometadata in list(metadatas):
-        regex_path = re.sub(r'\{\d+\}', r'([^/]+)', abs_seometadata.path)
-        regex_path = '^' + regex_path + '$'
-        match = re.search(regex_path, path)
+        match = re.search(get_path_regex(abs_seometadata.path), path)
         if match:
             matches.append({
                 'seometadata': abs_seometadata,
@@ -146,77 +144,532 @@ def get_abstract_matches(path, metadatas):
     return matches
 
 
+def get_exact_metadata(path, lang_code, versions=None):
+    """
+    Returns the SeoMetadata defined for exactly this path, preferring the
+    one in lang_code over the one in the default language. versions are the
+    SeoVersions already read for the current resolution, if any.
+    """
+    snapshot = get_snapshot(versions)
+    if snapshot is not None:
+        candidates = snapshot.get_exact(path, lang_code)
+        if not candidates and lang_code != settings.DEFAULT_LANG_CODE:
+            candidates = snapshot.get_exact(path, settings.DEFAULT_LANG_CODE)
+        return candidates[0] if candidates else None
+
+    lang_codes = get_possible_lang_codes(
+        path, [lang_code, settings.DEFAULT_LANG_CODE], versions)
+    if not lang_codes:
+        return None
+
+    # A single query for both languages, the current one first
+    return SeoMetadata.objects.filter(
+        path=path, lang_code__in=lang_codes).only(
+        *RESOLVER_FIELDS).order_by(
+        Case(When(lang_code=lang_code, then=Value(0)),
+             default=Value(1), output_field=models.IntegerField()),
+        'id').first()
+
+
+def get_path_pattern_index(lang_code, path=None, versions=None):
+    snapshot = get_snapshot(versions)
+    if snapshot is not None:
+        return snapshot.get_pattern_index(lang_code)
+    return get_pattern_index(lang_code, path, versions)
+
+
+def is_content_object(seometadata, instance):
+    return instance is not None and \
+        instance.pk == seometadata.object_id and \
+        ContentType.objects.get_for_model(instance).id == \
+        seometadata.content_type_id
+
+
+def get_content_object(seometadata, instance=None):
+    # Avoid fetching the related object again if it is the given instance
+    if seometadata.content_type_id is None:
+        return None
+    if is_content_object(seometadata, instance):
+        return instance
+    # Not cached on seometadata, that could be shared by the snapshot
+    model_class = ContentType.objects.get_for_id(
+        seometadata.content_type_id).model_class()
+    return model_class._base_manager.filter(
+        pk=seometadata.object_id).first()
+
+
 def get_path_metadata(path, lang_code, instance=None, seo_context={}):
-    # By default, fallback to general default
     path = smart_str(urlparse(path).path)
+    if settings.SEO_STATS:
+        return stats.measure(lookup_path_metadata, path, lang_code, instance,
+                             seo_context)
+    return lookup_path_metadata(path, lang_code, instance, seo_context)[0]
+
+
+def lookup_path_metadata(path, lang_code, instance=None, seo_context={}):
+    """
+    Returns the (formatted metadata, tier) for the path, reusing the one
+    stored in the SEO_CACHE_ALIAS cache if any.
+    """
+    cache = get_seo_cache()
+    # Read once, and passed down to every per process cache
+    versions = get_versions(instance, cache)
+    if cache is None:
+        return resolve_path_metadata(path, lang_code, instance, seo_context,
+                                     versions)[:2]
+
+    key = get_metadata_key(path, lang_code, instance, seo_context, versions)
+    formatted_result = get_cached_result(key, cache)
+    if formatted_result is not None:
+        return formatted_result, stats.TIER_CACHE
+
+    formatted_result, tier, content_object = resolve_path_metadata(
+        path, lang_code, instance, seo_context, versions)
+    # Also invalidated by saving the content object of the metadata
+    set_cached_result(key, formatted_result, instance, content_object, cache)
+    return formatted_result, tier
+
+
+def resolve_path_metadata(path, lang_code, instance=None, seo_context={},
+                          versions=None):
+    """
+    Returns the (formatted metadata, tier, instance used to format it).
+    """
+    result, instance, path_args, tier = find_path_metadata(
+        path, lang_code, instance, versions=versions)
+    return format_metadata(result, instance, lang_code, path_args,
+                           seo_context), tier, instance
+
+
+def find_path_metadata(path, lang_code, instance=None,
+                       get_exact=get_exact_metadata,
+                       get_content=get_content_object, versions=None):
+    """
+    Returns the (unformatted metadata, instance, path args, tier) for the
+    path.
+    """
+    if versions is None:
+        versions = get_versions()
+
+    # By default, fallback to general default
     index = int(hashlib.md5(path.encode('utf-8')).hexdigest(), 16)
     result = get_fallback_metadata(lang_code, index=index)
 
     # Find correct metadata
-    seometadata = None
     path_args = []
+    tier = stats.TIER_FALLBACK
 
-    try:
-        # Try to find exact match
-        seometadata = SeoMetadata.objects.filter(
-            path=path).get(
-                Q(lang_code=lang_code) |
-                Q(lang_code=settings.DEFAULT_LANG_CODE))
-
-    except SeoMetadata.MultipleObjectsReturned:
-        # More than one was found for this path, select the one with current
-        # lang
-        seometadata = SeoMetadata.objects.filter(
-            path=path, lang_code=lang_code)
-
-        if seometadata.exists():
-            return seometadata.first()
-
-    except SeoMetadata.DoesNotExist:
+    # Paths known to have no SeoMetadata skip the exact and pattern lookups
+    known_miss = is_known_miss(path, lang_code, versions)
+
+    # Try to find exact match
+    seometadata = None if known_miss else get_exact(path, lang_code,
+                                                    versions)
+
+    if seometadata is not None:
+        tier = stats.TIER_EXACT if seometadata.lang_code == lang_code \
+            else stats.TIER_LANGUAGE
+    else:
         min_priority = 0
         # Before looking for abstract paths, we will see if there is a SeoModel
         if instance:
             # Look for registered model default
-            instance_metadata = get_instance_metadata(instance, lang_code)
+            instance_metadata = get_instance_metadata(instance, lang_code,
+                                                      versions)
             if instance_metadata:
                 # If there was an instance metadata, priority is 5
                 min_priority = 5
                 result = instance_metadata
+                tier = stats.TIER_REGISTERED_MODEL
 
-        # SeoMetadata not found, try to find an alternative path
-        abstract_seometadatas = SeoMetadata.objects.filter(
-            has_parameters=True, priority__gte=min_priority
-            ).order_by('-priority')
-
-        abstract_lang = abstract_seometadatas.filter(lang_code=lang_code)
-        abstract_en = abstract_seometadatas.filter(
-            lang_code=settings.DEFAULT_LANG_CODE)
-
+        # SeoMetadata not found, try to find an alternative path.
         # Collect all metadatas that matches the path
-        matches = get_abstract_matches(path, abstract_lang)
+        matches = [] if known_miss else get_path_pattern_index(
+            lang_code, path, versions).match(path, min_priority)
 
         # If no matches on lang, check default lang
-        if len(matches) == 0:
-            matches = get_abstract_matches(path, abstract_en)
+        if len(matches) == 0 and not known_miss:
+            matches = get_path_pattern_index(
+                settings.DEFAULT_LANG_CODE, path, versions).match(
+                path, min_priority)
 
         if len(matches) > 0:
             random_match = matches[index % len(matches)]
             seometadata = random_match['seometadata']
             path_args = random_match['groups']
+            tier = stats.TIER_PARAMETERIZED
+        elif min_priority == 0 and not known_miss:
+            add_known_miss(path, lang_code)
 
     if seometadata:
         # If seometadata found
         result = seometadata.get_metadata()
-        instance = seometadata.content_object or instance
+        instance = get_content(seometadata, instance) or instance
 
     # At this point, result contains the resolved value before formatting.
-    formatted_result = format_metadata(result, instance, lang_code, path_args,
-                                       seo_context)
+    return result, instance, path_args, tier
+
+
+def get_exact_metadata_many(keys, versions=None):
+    """
+    Same as get_exact_metadata for many (path, lang_code) keys, with a
+    single query. Returns {(path, lang_code): seometadata or None}.
+    """
+    keys = set(keys)
+    if versions is None:
+        versions = get_versions()
+    snapshot = get_snapshot(versions)
+    if snapshot is not None or not keys:
+        return dict((key, get_exact_metadata(*key, versions=versions))
+                    for key in keys)
+
+    paths = set(path for path, lang_code in keys if get_possible_lang_codes(
+        path, [lang_code, settings.DEFAULT_LANG_CODE], versions))
+    lang_codes = set(lang_code for path, lang_code in keys)
+    lang_codes.add(settings.DEFAULT_LANG_CODE)
+    candidates = {}
+    if not paths:
+        return dict((key, None) for key in keys)
+    for seometadata in SeoMetadata.objects.filter(
+            path__in=paths, lang_code__in=lang_codes).only(
+            *RESOLVER_FIELDS).order_by('id'):
+        candidates.setdefault(
+            (seometadata.path, seometadata.lang_code), seometadata)
+
+    return dict(
+        ((path, lang_code),
+         candidates.get((path, lang_code)) or
+         candidates.get((path, settings.DEFAULT_LANG_CODE)))
+        for path, lang_code in keys)
+
+
+def get_content_objects(metadatas):
+    """
+    Fetches the related objects of many SeoMetadata with one query per
+    model. Returns {(content_type_id, object_id): object}.
+    """
+    ids_by_ctype = {}
+    for seometadata in metadatas:
+        if seometadata is not None and seometadata.content_type_id:
+            ids_by_ctype.setdefault(seometadata.content_type_id, set()).add(
+                seometadata.object_id)
+
+    objects = {}
+    for ctype_id, ids in ids_by_ctype.items():
+        model_class = ContentType.objects.get_for_id(ctype_id).model_class()
+        found = model_class._base_manager.in_bulk(list(ids))
+        for pk in ids:
+            objects[(ctype_id, pk)] = found.get(pk)
+    return objects
+
+
+def get_path_metadata_many(items):
+    """
+    Resolves many (path, lang_code, instance) tuples, optionally followed by
+    their seo_context, at once. Exact paths are fetched with a single query,
+    the rest are matched against the in memory indexes, and the results are
+    returned in the same order.
+    """
+    requests = []
+    for item in items:
+        path, lang_code, instance = item[:3]
+        seo_context = item[3] if len(item) > 3 else {}
+        requests.append((smart_str(urlparse(path).path), lang_code, instance,
+                         seo_context))
+
+    results = [None] * len(requests)
+    pending = list(range(len(requests)))
+    cache = get_seo_cache()
+    versions = get_versions(cache=cache)
+    if cache is not None:
+        instance_versions = get_instance_versions(
+            [request[2] for request in requests], cache)
+        keys = [
+            get_metadata_key(*request, versions=versions,
+                             instance_version=instance_versions.get(
+                                 get_instance_key(request[2])))
+            for request in requests]
+        cached = cache.get_many(set(keys))
+        version_keys = get_entries_version_keys(cached.values())
+        found_versions = cache.get_many(version_keys) if version_keys else {}
+        for position, key in enumerate(keys):
+            results[position] = get_fresh_result(cached.get(key),
+                                                 found_versions)
+        pending = [position for position in pending
+                   if results[position] is None]
+
+    exact = get_exact_metadata_many(
+        ((requests[position][0], requests[position][1])
+         for position in pending), versions)
+    objects = get_content_objects(exact.values())
+
+    def get_exact(path, lang_code, versions=None):
+        return exact[(path, lang_code)]
+
+    def get_content(seometadata, instance=None):
+        key = (seometadata.content_type_id, seometadata.object_id)
+        if key in objects and not is_content_object(seometadata, instance):
+            return objects[key]
+        return get_content_object(seometadata, instance)
+
+    found = {}
+    for position in pending:
+        path, lang_code, instance, seo_context = requests[position]
+        found[position] = find_path_metadata(
+            path, lang_code, instance, get_exact=get_exact,
+            get_content=get_content, versions=versions)
+    prefetch_instances_many(
+        (result, instance, requests[position][1])
+        for position, (result, instance, path_args, tier) in found.items())
+
+    for position, (result, instance, path_args, tier) in found.items():
+        path, lang_code, request_instance, seo_context = requests[position]
+        results[position] = format_metadata(
+            result, instance, lang_code, path_args, seo_context)
+
+    if cache is not None and pending:
+        # Also invalidated by saving the content object of the metadata
+        content_objects = dict(
+            (position, get_versioned_object(requests[position][2], instance))
+            for position, (result, instance, path_args, tier)
+            in found.items())
+        content_versions = get_instance_versions(content_objects.values(),
+                                                 cache)
+        cache.set_many(dict(
+            (keys[position], build_cache_entry(
+                results[position], content_objects[position],
+                content_versions))
+            for position in pending), settings.SEO_CACHE_TIMEOUT)
+    return results
+
+
+def iter_resolved_metadata(queryset=None, chunk_size=2000):
+    """
+    Yields the path, lang_code and formatted title and description of every
+    SeoMetadata in queryset (all those without parameters by default). Rows
+    are streamed from the database in chunks, so memory use doesn't depend
+    on the size of the table.
+    """
+    if queryset is None:
+        queryset = SeoMetadata.objects.filter(has_parameters=False)
+    rows = queryset.order_by('id').only(*RESOLVER_FIELDS).iterator(
+        chunk_size=chunk_size)
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+
+        objects = get_content_objects(chunk)
+        found = [(seometadata, seometadata.get_metadata(), objects.get(
+            (seometadata.content_type_id, seometadata.object_id)))
+            for seometadata in chunk]
+        prefetch_instances_many(
+            (result, instance, seometadata.lang_code)
+            for seometadata, result, instance in found)
+
+        for seometadata, result, instance in found:
+            formatted_result = format_metadata(result, instance,
+                                               seometadata.lang_code)
+            yield {
+                'path': seometadata.path,
+                'lang_code': seometadata.lang_code,
+                'title': formatted_result['title'],
+                'description': formatted_result['description'],
+            }
+
+
+async def aget_content_type(model):
+    # get_for_model only queries the first time for every model, but its
+    # cache is only reachable through the sync API
+    return await sync_to_async(ContentType.objects.get_for_model)(model)
+
+
+async def aget_instance_metadata(instance, lang_code, versions=None):
+    """
+    Same as get_instance_metadata, for async code.
+    """
+    if instance:
+        ctype = await aget_content_type(type(instance))
+        snapshot = await aget_snapshot(versions)
+        if snapshot is not None:
+            available_metadata = snapshot.get_pool(ctype.id, lang_code)
+        else:
+            available_metadata = await aget_registered_pool(
+                ctype.id, lang_code, versions)
+
+        if available_metadata:
+            choosen = available_metadata[
+                get_stable_index(instance) % len(available_metadata)]
+            return {
+                'title': choosen.title,
+                'description': choosen.description,
+            }
+
+
+async def aget_exact_metadata(path, lang_code, versions=None):
+    """
+    Same as get_exact_metadata, for async code.
+    """
+    snapshot = await aget_snapshot(versions)
+    if snapshot is not None:
+        candidates = snapshot.get_exact(path, lang_code)
+        if not candidates and lang_code != settings.DEFAULT_LANG_CODE:
+            candidates = snapshot.get_exact(path, settings.DEFAULT_LANG_CODE)
+        return candidates[0] if candidates else None
+
+    lang_codes = await aget_possible_lang_codes(
+        path, [lang_code, settings.DEFAULT_LANG_CODE], versions)
+    if not lang_codes:
+        return None
+
+    return await SeoMetadata.objects.filter(
+        path=path, lang_code__in=lang_codes).only(
+        *RESOLVER_FIELDS).order_by(
+        Case(When(lang_code=lang_code, then=Value(0)),
+             default=Value(1), output_field=models.IntegerField()),
+        'id').afirst()
+
+
+async def aget_path_pattern_index(lang_code, path=None, versions=None):
+    snapshot = await aget_snapshot(versions)
+    if snapshot is not None:
+        return snapshot.get_pattern_index(lang_code)
+    return await aget_pattern_index(lang_code, path, versions)
+
+
+async def aget_content_object(seometadata, instance=None):
+    """
+    Same as get_content_object, for async code.
+    """
+    if seometadata.content_type_id is None:
+        return None
+    if instance is not None and instance.pk == seometadata.object_id:
+        ctype = await aget_content_type(type(instance))
+        if ctype.id == seometadata.content_type_id:
+            return instance
+    ctype = await sync_to_async(ContentType.objects.get_for_id)(
+        seometadata.content_type_id)
+    return await ctype.model_class()._base_manager.filter(
+        pk=seometadata.object_id).afirst()
+
+
+async def afind_path_metadata(path, lang_code, instance=None,
+                              versions=None):
+    """
+    Same as find_path_metadata, for async code. The exact match, the
+    registered model pool and the pattern index don't depend on each other,
+    so they are looked up concurrently.
+    """
+    if versions is None:
+        versions = await aget_versions()
+    index = int(hashlib.md5(path.encode('utf-8')).hexdigest(), 16)
+    result = get_fallback_metadata(lang_code, index=index)
+    path_args = []
+    tier = stats.TIER_FALLBACK
+
+    known_miss = await ais_known_miss(path, lang_code, versions)
+    if known_miss:
+        seometadata, pattern_index = None, None
+        instance_metadata = await aget_instance_metadata(
+            instance, lang_code, versions)
+    else:
+        seometadata, instance_metadata, pattern_index = await asyncio.gather(
+            aget_exact_metadata(path, lang_code, versions),
+            aget_instance_metadata(instance, lang_code, versions),
+            aget_path_pattern_index(lang_code, path, versions))
+
+    if seometadata is not None:
+        tier = stats.TIER_EXACT if seometadata.lang_code == lang_code \
+            else stats.TIER_LANGUAGE
+    else:
+        min_priority = 0
+        if instance_metadata:
+            # If there was an instance metadata, priority is 5
+            min_priority = 5
+            result = instance_metadata
+            tier = stats.TIER_REGISTERED_MODEL
+
+        matches = [] if known_miss else pattern_index.match(
+            path, min_priority)
+
+        # If no matches on lang, check default lang
+        if len(matches) == 0 and not known_miss:
+            matches = (await aget_path_pattern_index(
+                settings.DEFAULT_LANG_CODE, path, versions)).match(
+                path, min_priority)
+
+        if len(matches) > 0:
+            random_match = matches[index % len(matches)]
+            seometadata = random_match['seometadata']
+            path_args = random_match['groups']
+            tier = stats.TIER_PARAMETERIZED
+        elif min_priority == 0 and not known_miss:
+            add_known_miss(path, lang_code)
 
+    if seometadata:
+        result = seometadata.get_metadata()
+        instance = await aget_content_object(seometadata, instance) or \
+            instance
+
+    return result, instance, path_args, tier
+
+
+async def aresolve_path_metadata(path, lang_code, instance=None,
+                                 seo_context={}, versions=None):
+    result, instance, path_args, tier = await afind_path_metadata(
+        path, lang_code, instance, versions)
+    if instance and lang_code:
+        # Instance attributes may follow relations, that are still loaded
+        # with the sync ORM
+        return await sync_to_async(format_metadata)(
+            result, instance, lang_code, path_args, seo_context), tier, \
+            instance
+    return format_metadata(result, instance, lang_code, path_args,
+                           seo_context), tier, instance
+
+
+async def aget_path_metadata(path, lang_code, instance=None, seo_context={}):
+    """
+    Same as get_path_metadata, for async views.
+    """
+    path = smart_str(urlparse(path).path)
+    if not settings.SEO_STATS:
+        return (await alookup_path_metadata(
+            path, lang_code, instance, seo_context))[0]
+
+    start = time.perf_counter()
+    formatted_result, tier = await alookup_path_metadata(
+        path, lang_code, instance, seo_context)
+    stats.record(path, lang_code, tier, time.perf_counter() - start)
     return formatted_result
 
 
+async def alookup_path_metadata(path, lang_code, instance=None,
+                                seo_context={}):
+    cache = get_seo_cache()
+    versions = await aget_versions(instance, cache)
+    if cache is None:
+        return (await aresolve_path_metadata(
+            path, lang_code, instance, seo_context, versions))[:2]
+
+    key = get_metadata_key(path, lang_code, instance, seo_context, versions)
+    formatted_result = await aget_cached_result(key, cache)
+    if formatted_result is not None:
+        return formatted_result, stats.TIER_CACHE
+
+    formatted_result, tier, content_object = await aresolve_path_metadata(
+        path, lang_code, instance, seo_context, versions)
+    await aset_cached_result(key, formatted_result, instance, content_object,
+                             cache)
+    return formatted_result, tier
+
+
 def update_seo(sender, instance, auto_languages=[], **kwargs):
+    if settings.SEO_DEFER_UPDATES and 'signal' in kwargs:
+        defer_update_seo(instance, using=kwargs.get('using'))
+        return
+
     active_lang = get_language()
 
     for lang_code, lang_name in settings.SEO_LANGUAGES:
@@ -252,18 +705,210 @@ def update_seo(sender, instance, auto_languages=[], **kwargs):
                     sm.save()
 
     activate(active_lang)
+    # The instance fields may be used by its metadata. Changes to its
+    # SeoMetadata already invalidate everything through their signals.
+    bump_instance_versions([instance])
+
+
+def bulk_update_seo(model_class, instances, auto_languages=[],
+                    languages=None):
+    """
+    Same as calling update_seo for every instance, but fetching their
+    SeoMetadata in a single query, activating every language only once and
+    writing the changes with bulk_create and bulk_update.
+
+    Returns a (created, updated) tuple.
+    """
+    instances = list(instances)
+    if languages is None:
+        languages = [lang_code for lang_code, lang_name
+                     in settings.SEO_LANGUAGES]
+    if not instances or not languages:
+        return 0, 0
+
+    ctype = ContentType.objects.get_for_model(model_class)
+    existing = {}
+    for sm in SeoMetadata.objects.filter(
+            content_type=ctype,
+            object_id__in=[instance.pk for instance in instances],
+            lang_code__in=languages):
+        existing.setdefault((sm.object_id, sm.lang_code), []).append(sm)
+
+    to_create = []
+    to_update = []
+    active_lang = get_language()
+    try:
+        for lang_code in languages:
+            activate(lang_code)
+            for instance in instances:
+                sms = existing.get((instance.pk, lang_code))
+                if sms:
+                    # If it exists, update path
+                    absolute_url = instance.get_absolute_url()
+                    for sm in sms:
+                        if absolute_url and absolute_url != sm.path:
+                            sm.path = absolute_url
+                            to_update.append(sm)
+                elif lang_code in auto_languages:
+                    # If it does not exists, only create if it is requested
+                    absolute_url = instance.get_absolute_url()
+                    if absolute_url:
+                        metadata = get_instance_metadata(
+                            instance, lang_code) or \
+                            get_fallback_metadata(lang_code)
+                        to_create.append(SeoMetadata(
+                            content_type=ctype,
+                            object_id=instance.pk,
+                            lang_code=lang_code,
+                            path=absolute_url,
+                            title=metadata["title"],
+                            description=metadata["description"]))
+    finally:
+        activate(active_lang)
+
+    if to_create:
+        SeoMetadata.objects.bulk_create(to_create)
+    if to_update:
+        SeoMetadata.objects.bulk_update(to_update, ['path'])
+    # Instance fields may be used by its metadata
+    bump_instance_versions(instances)
+    if to_create or to_update:
+        # Bulk writes don't send signals
+        clear_seo_caches()
+    return len(to_create), len(to_update)
+
+
+def get_deferred_pending():
+    pending = getattr(_deferred, 'pending', None)
+    if pending is None:
+        pending = _deferred.pending = {}
+    return pending
+
+
+def get_transaction_key(connection):
+    """
+    Identifies the atomic block being run in the connection, by its
+    outermost block and the ids of the savepoints opened inside it. None
+    outside of a transaction.
+    """
+    if not connection.in_atomic_block:
+        return None
+    return (tuple(connection.atomic_blocks[:1]),
+            tuple(connection.savepoint_ids))
+
+
+def defer_update_seo(instance, using=None):
+    """
+    Marks the instance to be synced once the current transaction of the
+    using database commits, together with the rest of instances saved in
+    the same atomic block.
+    """
+    using = using or DEFAULT_DB_ALIAS
+    key = get_transaction_key(connections[using])
+    pending = get_deferred_pending()
+    pending_key, instances = pending.get(using, (None, None))
+    # Entering or leaving a savepoint registers a new callback, so rolling
+    # it back only discards the instances marked inside it.
+    register = key is None or key != pending_key
+    if register:
+        instances = set()
+        pending[using] = (key, instances)
+    instances.add((ContentType.objects.get_for_model(instance).id,
+                   instance.pk))
+    if register:
+        # Outside of a transaction it runs right away
+        transaction.on_commit(partial(flush_deferred_seo, using, instances),
+                              using=using)
+
+
+def flush_deferred_seo(using=DEFAULT_DB_ALIAS, instances=None):
+    """
+    Syncs the SeoMetadata of the instances marked by defer_update_seo in
+    the using database, all the pending ones by default.
+    """
+    pending_key, pending = get_deferred_pending().get(using, (None, None))
+    if instances is None or instances is pending:
+        get_deferred_pending().pop(using, None)
+    if instances is None:
+        instances = pending
+    if not instances:
+        return
+
+    pks_by_ctype = {}
+    for ctype_id, pk in instances:
+        pks_by_ctype.setdefault(ctype_id, []).append(pk)
+
+    for ctype_id, pks in pks_by_ctype.items():
+        model_class = ContentType.objects.get_for_id(ctype_id).model_class()
+        for index in range(0, len(pks), DEFERRED_CHUNK_SIZE):
+            bulk_update_seo(
+                model_class,
+                model_class._base_manager.using(using).filter(
+                    pk__in=pks[index:index + DEFERRED_CHUNK_SIZE]))
+
+
+def clear_seo_caches():
+    """
+    Invalidates every cached resolution, in this and in the rest of
+    processes. Needed after writes that don't send model signals, like
+    bulk_create or update.
+    """
+    bump_generation()
+    clear_pattern_indexes()
+    clear_registered_pools()
+    check_routing_file()
+    clear_misses()
+    bump_metadata_version()
+    bump_models_version()
 
 
 def delete_seo(sender, instance, **kwargs):
     ctype = ContentType.objects.get_for_model(instance)
-    for sm in SeoMetadata.objects.filter(content_type=ctype, object_id=instance.id):
-        sm.delete()
+    # Sends the post_delete signals invalidating the caches, if any row
+    SeoMetadata.objects.filter(
+        content_type=ctype, object_id=instance.pk).delete()
+
+
+def delete_orphaned_seo(model_class):
+    """
+    Deletes the SeoMetadata of model_class whose object doesn't exist
+    anymore, finding them in a single query and deleting them in chunks of
+    ORPHANS_CHUNK_SIZE. Returns the number of deleted rows.
+    """
+    ctype = ContentType.objects.get_for_model(model_class)
+    pks = list(SeoMetadata.objects.filter(
+        content_type=ctype, object_id__isnull=False).exclude(
+        object_id__in=model_class._base_manager.values('pk')).values_list(
+        'pk', flat=True))
+    count = 0
+    for index in range(0, len(pks), ORPHANS_CHUNK_SIZE):
+        # Sends the post_delete signals invalidating the caches
+        deleted, by_model = SeoMetadata.objects.filter(
+            pk__in=pks[index:index + ORPHANS_CHUNK_SIZE]).delete()
+        count += deleted
+    return count
 
 
 def register_seo_signals():
+    """
+    Connects update_seo and delete_seo to every model in SEO_MODELS. Models
+    are found through the app registry, so it doesn't query the database.
+    """
     for app, model in settings.SEO_MODELS:
-        ctype = ContentType.objects.get(app_label=app.lower(), model=model.lower())
-        if not hasattr(ctype.model_class(), 'get_absolute_url'):
-            raise ImproperlyConfigured("Needed get_absolute_url method not defined on %s.%s model." % (app, model))
-        models.signals.post_save.connect(update_seo, sender=ctype.model_class(), weak=False)
-        models.signals.pre_delete.connect(delete_seo, sender=ctype.model_class(), weak=False)
+        try:
+            model_class = apps.get_model(app, model)
+        except LookupError:
+            raise ImproperlyConfigured(
+                "%s.%s model in SEO_MODELS is not installed." % (app, model))
+        if not hasattr(model_class, 'get_absolute_url'):
+            raise ImproperlyConfigured(
+                "Needed get_absolute_url method not defined on %s.%s model."
+                % (app, model))
+        dispatch_uid = 'painlessseo_%s_%s' % (
+            model_class._meta.app_label, model_class._meta.model_name)
+        models.signals.post_save.connect(
+            update_seo, sender=model_class, weak=False,
+            dispatch_uid=dispatch_uid + '_update')
+        models.signals.pre_delete.connect(
+            delete_seo, sender=model_class, weak=False,
+            dispatch_uid=dispatch_uid + '_delete')
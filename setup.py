@@ -40,17 +40,21 @@ setup(
         'Development Status :: 0.1.11 ',
         'Environment :: Web Environment',
         'Framework :: Django',
+        'Framework :: Django :: 4.2',
+        'Framework :: Django :: 5.2',
         'Intended Audience :: Developers',
         'License :: OSI Approved :: BSD License',
         'Operating System :: OS Independent',
-        'Programming Language :: Python :: 2 :: Only',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
         'Topic :: Software Development :: Libraries :: Python Modules',
         'Topic :: Internet'
     ],
     description='Painless SEO app for Django framework',
     keywords='seo django',
     long_description=open('README.md').read(),
-    requires=[
-        'Django (>=1.6.0)',
+    python_requires='>=3.8',
+    install_requires=[
+        'Django>=4.2',
     ],
 )